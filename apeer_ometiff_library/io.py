@@ -1,7 +1,11 @@
 import struct
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from types import TracebackType
-from typing import Union, Optional, Type, Tuple, List
+from typing import Union, Optional, Type, Tuple, List, Sequence, NamedTuple, Hashable
 
 import tifffile
 import numpy as np
@@ -9,12 +13,153 @@ import sys
 from apeer_ometiff_library import omexmlClass
 
 PathLike = Union[str, Path]
+PlaneSelection = Optional[Union[int, slice, Sequence[int]]]
+
+
+class ImageSummary:
+    """
+    Immutable summary of the dimensions of one OME image, see OmeTiffFile.images
+
+    ifd_map is a read-only array of shape (size_t, size_z, size_c) holding the IFD of every plane,
+    or -1 for planes not stored in the file. With samples_per_pixel > 1, consecutive channels are
+    samples of the same IFD.
+    """
+
+    __slots__ = (
+        "size_t",
+        "size_z",
+        "size_c",
+        "size_y",
+        "size_x",
+        "dimension_order",
+        "samples_per_pixel",
+        "pixel_type",
+        "physical_size_x",
+        "physical_size_y",
+        "physical_size_z",
+        "ifd_map",
+    )
+
+    def __init__(self, pixels: omexmlClass.OMEXML.Pixels, local_files: Optional[set] = None):
+        ifd_map = _get_ifd_map(pixels, local_files)
+        ifd_map.setflags(write=False)
+        values = {
+            "size_t": pixels.SizeT,
+            "size_z": pixels.SizeZ,
+            "size_c": pixels.SizeC,
+            "size_y": pixels.SizeY,
+            "size_x": pixels.SizeX,
+            "dimension_order": pixels.DimensionOrder,
+            "samples_per_pixel": _get_samples_per_pixel(pixels),
+            "pixel_type": pixels.PixelType,
+            "physical_size_x": pixels.PhysicalSizeX,
+            "physical_size_y": pixels.PhysicalSizeY,
+            "physical_size_z": pixels.PhysicalSizeZ,
+            "ifd_map": ifd_map,
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    @property
+    def shape(self) -> Tuple[int, int, int, int, int]:
+        """Shape of the image in TZCYX order"""
+        return self.size_t, self.size_z, self.size_c, self.size_y, self.size_x
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}(shape={self.shape}, dimension_order={self.dimension_order!r}, "
+            f"pixel_type={self.pixel_type!r})"
+        )
+
+
+class CacheInfo(NamedTuple):
+    """Statistics of the decoded plane cache of an OmeTiffFile, see OmeTiffFile.cache_info"""
+
+    hits: int
+    misses: int
+    max_bytes: int
+    current_bytes: int
+
+
+class _PlaneCache:
+    """Thread-safe LRU cache of decoded planes, bounded by the total number of bytes they hold"""
+
+    def __init__(self, max_bytes: int):
+        if max_bytes < 0:
+            raise ValueError(f"Cache size must not be negative, got {max_bytes}")
+        self._max_bytes = max_bytes
+        self._planes = OrderedDict()
+        self._current_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        with self._lock:
+            plane = self._planes.get(key)
+            if plane is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._planes.move_to_end(key)
+            return plane
+
+    def put(self, key: Hashable, plane: np.ndarray) -> None:
+        if plane.nbytes > self._max_bytes:
+            return
+        # cached planes are shared between callers
+        plane.setflags(write=False)
+        with self._lock:
+            if key in self._planes:
+                return
+            self._planes[key] = plane
+            self._current_bytes += plane.nbytes
+            while self._current_bytes > self._max_bytes:
+                self._current_bytes -= self._planes.popitem(last=False)[1].nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._planes.clear()
+            self._current_bytes = 0
+            self._hits = 0
+            self._misses = 0
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._max_bytes, self._current_bytes)
 
 
 class OmeTiffFile:
-    def __init__(self, path: PathLike):
+    """
+    Reader for the images of an OME-TIFF file
+
+    cache_bytes enables an LRU cache of decoded planes holding up to that many bytes. Planes read
+    with read_plane and plane selections of read are cached and served from it, and read_region
+    slices cached planes instead of decoding the strips or tiles again. Cached planes are
+    returned read-only. Reads of whole images bypass the cache.
+    """
+
+    def __init__(self, path: PathLike, cache_bytes: int = 0):
         self._path = path
         self._tiff_file = tifffile.TiffFile(self._path)
+        # the OME-XML is parsed once, all read paths work on the image summaries
+        self._omexml_string = self._tiff_file.ome_metadata
+        metadata = omexmlClass.OMEXML(self._omexml_string)
+        # planes referencing another file by UUID or FileName, e.g. of a split_by file set, are
+        # not stored in this one
+        local_files = {metadata.root_node.get("UUID"), Path(path).name}
+        self._images = tuple(
+            ImageSummary(omexmlClass.OMEXML.Image(node).Pixels, local_files)
+            for node in metadata.root_node.findall(omexmlClass.qn(metadata.ns["ome"], "Image"))
+        )
+        self._level_pages = {}
+        self._cache = _PlaneCache(cache_bytes) if cache_bytes else None
 
     def __enter__(self) -> "OmeTiffFile":
         return self
@@ -31,106 +176,713 @@ class OmeTiffFile:
     def close(self) -> None:
         self._tiff_file.close()
 
+    def cache_info(self) -> CacheInfo:
+        """Return the hit and miss counts and the size in bytes of the decoded plane cache"""
+        if self._cache is None:
+            return CacheInfo(0, 0, 0, 0)
+        return self._cache.info()
+
+    def cache_clear(self) -> None:
+        """Empty the decoded plane cache and reset its statistics"""
+        if self._cache is not None:
+            self._cache.clear()
+
     @property
     def is_multi_series(self):
-        return omexmlClass.OMEXML(self._tiff_file.ome_metadata).image_count > 1
+        return len(self._images) > 1
 
-    def read(self) -> Tuple[np.ndarray, str]:
-        omexml_string = self._tiff_file.ome_metadata
-        array = _ensure_correct_dimensions(self._tiff_file.asarray(), omexml_string)
-        return array, omexml_string
+    @property
+    def images(self) -> Tuple[ImageSummary, ...]:
+        """Dimension summaries of all images (= series) in the file"""
+        return self._images
 
-    def read_multi_series(self) -> Tuple[List[np.ndarray], str]:
-        omexml_string = self._tiff_file.ome_metadata
-        arrays = [
-            _ensure_correct_dimensions(
-                self._tiff_file.asarray(key=image_key), omexml_string
+    @property
+    def omexml_string(self) -> str:
+        """The OME-XML metadata of the file, as returned by read"""
+        return self._omexml_string
+
+    def read(
+        self,
+        t: PlaneSelection = None,
+        z: PlaneSelection = None,
+        c: PlaneSelection = None,
+        mode: str = "memory",
+        level: int = 0,
+        max_workers: Optional[int] = None,
+        axes: str = "TZCYX",
+    ) -> Tuple[np.ndarray, str]:
+        """
+        Read the first image of the file, as a 5D array in TZCYX order by default
+
+        Parameters
+        ----------
+        t, z, c : Optional[int, slice or sequence of int]
+            Planes to read along the T, Z and C dimensions. If any of them is given, only the
+            IFDs holding the selected planes are decoded. Dimensions are kept, i.e. an int
+            selects a single plane along that dimension but the result stays 5D.
+        mode : str
+            "memory" (default) decodes the pixel data into RAM. "memmap" returns a read-only
+            numpy.memmap backed view of the file instead, which requires the pixel data to be
+            uncompressed and stored contiguously, and SamplesPerPixel > 1 to be stored in a
+            single IFD per T and Z unless planar separate. Int and slice selections keep the view.
+        level : int
+            Pyramid level to read, 0 (default) is the full resolution. See `levels`.
+        max_workers : Optional[int]
+            Number of threads decoding compressed IFDs concurrently into the output array.
+            By default, up to half of the CPU cores are used. 1 disables multi-threading.
+        axes : str
+            Order of the dimensions of the returned array, e.g. "TCZYX" or "ZYX". Dimensions left
+            out are dropped and must have a size of 1 (after the plane selection). The array is
+            reordered as a view, the pixel data is not copied.
+        """
+        if mode not in ("memory", "memmap"):
+            raise ValueError(f"Unknown read mode {mode!r}, expected 'memory' or 'memmap'")
+
+        omexml_string = self._omexml_string
+        if mode == "memmap":
+            array = _select_planes(self._memmap(level), t, z, c)
+        elif t is None and z is None and c is None:
+            array = _ensure_correct_dimensions(
+                self._tiff_file.asarray(level=level, maxworkers=max_workers),
+                self._images[0],
+                self._is_planar_separate(0),
+                self._level_size_yx(level),
+            )
+        else:
+            array = self._read_planes(t, z, c, level, max_workers)
+        return _transpose_axes(array, axes), omexml_string
+
+    @property
+    def levels(self) -> List[Tuple[int, int, int, int, int]]:
+        """TZCYX shapes of the pyramid levels of the first image, starting with the full resolution"""
+        size_t, size_z, size_c = self._images[0].ifd_map.shape
+        return [
+            (size_t, size_z, size_c) + self._level_size_yx(level)
+            for level in range(len(self._tiff_file.series[0].levels))
+        ]
+
+    def as_array(self, level: int = 0) -> "OmeTiffArray":
+        """
+        Return a lazy 5D TZCYX view of the first image, see OmeTiffArray
+
+        Pixel data is only read when the view is indexed or converted with numpy.asarray. The
+        view is only usable while the file is open.
+        """
+        return OmeTiffArray(self, level)
+
+    def read_plane(self, t: int = 0, z: int = 0, c: int = 0, level: int = 0) -> np.ndarray:
+        """Read a single YX plane of the first image, decoding only the IFD that holds it"""
+        ifd = self._get_plane_ifd(t, z, c)
+        plane = self._decode_page(ifd, level, self._get_page(ifd, level))
+        return _select_sample(plane, self._images[0], c, self._is_planar_separate(0))
+
+    def read_region(
+        self,
+        t: int = 0,
+        z: int = 0,
+        c: int = 0,
+        y: slice = slice(None),
+        x: slice = slice(None),
+        level: int = 0,
+    ) -> np.ndarray:
+        """
+        Read a YX window of a single plane of the first image
+
+        Only the strips or tiles of the plane overlapping the window are read and decoded.
+
+        Parameters
+        ----------
+        t, z, c : int
+            Index of the plane to read from.
+        y, x : slice
+            Window to read along the Y and X dimensions of the plane, in pixels of the given level.
+        level : int
+            Pyramid level to read from, 0 (default) is the full resolution.
+        """
+        ifd = self._get_plane_ifd(t, z, c)
+        if self._cache is not None:
+            plane = self._cache.get((ifd, level))
+            if plane is not None:
+                return _select_sample(plane, self._images[0], c, self._is_planar_separate(0))[y, x]
+        page = self._get_page(ifd, level)
+        if not isinstance(page, tifffile.TiffPage):
+            # TiffFrames do not expose the strip and tile layout of the page
+            page = page.aspage()
+        return _select_sample(_read_page_region(page, y, x), self._images[0], c, False)
+
+    def _get_plane_ifd(self, t: int, z: int, c: int) -> int:
+        ifd = self._images[0].ifd_map[t, z, c]
+        if ifd < 0:
+            raise ValueError(f"Plane (t={t}, z={z}, c={c}) is not stored in this file")
+        return int(ifd)
+
+    def _level_size_yx(self, level: int) -> Tuple[int, int]:
+        keyframe = self._tiff_file.series[0].levels[level].keyframe
+        return keyframe.imagelength, keyframe.imagewidth
+
+    def _is_planar_separate(self, key: int) -> bool:
+        return self._tiff_file.pages[key].planarconfig == 2
+
+    def _get_page(self, ifd: int, level: int) -> Union[tifffile.TiffPage, tifffile.TiffFrame]:
+        if level == 0:
+            return self._tiff_file.pages[ifd]
+        if level not in self._level_pages:
+            series = self._tiff_file.series[0]
+            # sub-resolution pages are listed in the same order as the full resolution pages
+            self._level_pages[level] = {
+                page.index: level_page
+                for page, level_page in zip(series.pages, series.levels[level].pages)
+            }
+        try:
+            return self._level_pages[level][ifd]
+        except KeyError:
+            raise ValueError(f"IFD {ifd} has no pyramid level {level}") from None
+
+    def _decode_page(
+        self,
+        ifd: int,
+        level: int,
+        page: Union[tifffile.TiffPage, tifffile.TiffFrame],
+        max_workers: Optional[int] = None,
+    ) -> np.ndarray:
+        """Decode the page of an IFD at a pyramid level, through the plane cache if enabled"""
+        if self._cache is None:
+            return page.asarray(maxworkers=max_workers)
+        plane = self._cache.get((ifd, level))
+        if plane is None:
+            plane = page.asarray(maxworkers=max_workers)
+            self._cache.put((ifd, level), plane)
+        return plane
+
+    def _read_planes(
+        self,
+        t: PlaneSelection,
+        z: PlaneSelection,
+        c: PlaneSelection,
+        level: int = 0,
+        max_workers: Optional[int] = None,
+    ) -> np.ndarray:
+        ifd_map = self._images[0].ifd_map
+        ifds = ifd_map[
+            np.ix_(*(_selection_indices(sel, size) for sel, size in zip((t, z, c), ifd_map.shape)))
+        ]
+        if (ifds < 0).any():
+            raise ValueError("Selection contains planes that are not stored in this file")
+
+        series = self._tiff_file.series[0].levels[level]
+        keyframe = series.keyframe
+        array = np.empty(ifds.shape + (keyframe.imagelength, keyframe.imagewidth), dtype=series.dtype)
+        # pages are looked up up front, tifffile's page list is not thread-safe
+        pages = [
+            (index, int(ifd), self._get_page(int(ifd), level)) for index, ifd in np.ndenumerate(ifds)
+        ]
+        channels = _selection_indices(c, ifd_map.shape[2])
+        planar_separate = self._is_planar_separate(0)
+
+        def read_page(index, ifd, page):
+            if keyframe.samplesperpixel == 1 and self._cache is None:
+                page.asarray(out=array[index], maxworkers=1)
+            else:
+                plane = self._decode_page(ifd, level, page, max_workers=1)
+                array[index] = _select_sample(
+                    plane, self._images[0], channels[index[2]], planar_separate
+                )
+
+        if max_workers is None:
+            max_workers = tifffile.TIFF.MAXWORKERS
+        if max_workers < 2 or len(pages) < 2:
+            for plane in pages:
+                read_page(*plane)
+        else:
+            # seeks and reads of the file handle are only synchronised once its lock is enabled
+            self._tiff_file.filehandle.set_lock(True)
+            with ThreadPoolExecutor(max_workers) as executor:
+                for future in [executor.submit(read_page, *plane) for plane in pages]:
+                    future.result()
+        return array
+
+    def _memmap(self, level: int = 0) -> np.ndarray:
+        series = self._tiff_file.series[0].levels[level]
+        if series.dataoffset is None or not series.keyframe.is_memmappable:
+            raise ValueError(
+                "Pixel data is compressed or not stored contiguously and cannot be memory-mapped"
+            )
+        image = self._images[0]
+        planar_separate = self._is_planar_separate(0)
+        # decided before mapping, as merging the samples into the C axis would copy the whole image
+        if (image.samples_per_pixel > 1 and not planar_separate
+                and image.size_c // image.samples_per_pixel > 1):
+            raise ValueError(
+                "Interleaved samples stored in several IFDs per T and Z cannot be memory-mapped "
+                "as TZCYX without loading the image into memory"
             )
-            for image_key in range(
-                omexmlClass.OMEXML(self._tiff_file.ome_metadata).image_count
+        array = self._tiff_file.asarray(level=level, out="memmap")
+        return _ensure_correct_dimensions(array, image, planar_separate, self._level_size_yx(level))
+
+    def read_multi_series(
+        self, max_workers: Optional[int] = None, axes: str = "TZCYX"
+    ) -> Tuple[List[np.ndarray], str]:
+        omexml_string = self._omexml_string
+        arrays = [
+            _transpose_axes(
+                _ensure_correct_dimensions(
+                    self._tiff_file.asarray(key=image_key, maxworkers=max_workers),
+                    image,
+                    self._is_planar_separate(image_key),
+                ),
+                axes,
             )
+            for image_key, image in enumerate(self._images)
         ]
         return arrays, omexml_string
 
 
-def read_ometiff(input_path):
-    with tifffile.TiffFile(input_path) as tif:
-        array = tif.asarray()
-        omexml_string = tif.ome_metadata
+def read_ometiff(input_path, mode="memory", max_workers=None, axes="TZCYX"):
+    with OmeTiffFile(input_path) as ome_tiff_file:
+        return ome_tiff_file.read(mode=mode, max_workers=max_workers, axes=axes)
 
-    array = _ensure_correct_dimensions(array, omexml_string)
 
-    return array, omexml_string
+class OmeTiffArray:
+    """
+    Lazy 5D TZCYX array over the first image of an OmeTiffFile, see OmeTiffFile.as_array
 
+    Indexing with ints and slices reads only the planes selected along T, Z and C, and only the
+    strips or tiles of those planes overlapping the selected Y and X window. Sequences of ints
+    select planes along T, Z and C orthogonally, as in OmeTiffFile.read. numpy.asarray reads the
+    whole image.
+    """
 
-def _ensure_correct_dimensions(array, omexml_string):
-    # Turn Ome XML String to an Bioformats object for parsing
-    metadata = omexmlClass.OMEXML(omexml_string)
+    def __init__(self, ome_tiff_file: OmeTiffFile, level: int = 0):
+        self._file = ome_tiff_file
+        self._level = level
+        self._shape = tuple(ome_tiff_file.levels[level])
+        self._dtype = ome_tiff_file._tiff_file.series[0].levels[level].dtype
 
-    # Parse pixel sizes
-    pixels = metadata.image(0).Pixels
-    size_c = pixels.SizeC
-    size_t = pixels.SizeT
-    size_z = pixels.SizeZ
-    size_x = pixels.SizeX
-    size_y = pixels.SizeY
-    # Expand image array to 5D and make sure to return the array in (T, Z, C, X, Y) order
-    dim_format = pixels.DimensionOrder
-    if dim_format == "XYCZT":
-        if size_c == 1:
-            array = np.expand_dims(array, axis=-3)
-        if size_z == 1:
-            array = np.expand_dims(array, axis=-4)
-        if size_t == 1:
-            array = np.expand_dims(array, axis=-5)
-    elif dim_format == "XYZCT":
-        if size_z == 1:
-            array = np.expand_dims(array, axis=-3)
-        if size_c == 1:
-            array = np.expand_dims(array, axis=-4)
-        if size_t == 1:
-            array = np.expand_dims(array, axis=-5)
-        array = np.moveaxis(array, 1, 2)
-    elif dim_format == "XYCTZ":
-        if size_c == 1:
-            array = np.expand_dims(array, axis=-3)
-        if size_t == 1:
-            array = np.expand_dims(array, axis=-4)
-        if size_z == 1:
-            array = np.expand_dims(array, axis=-5)
-        array = np.moveaxis(array, 0, 1)
-    elif dim_format == "XYZTC":
-        if size_z == 1:
-            array = np.expand_dims(array, axis=-3)
-        if size_t == 1:
-            array = np.expand_dims(array, axis=-4)
-        if size_c == 1:
-            array = np.expand_dims(array, axis=-5)
-        array = np.moveaxis(array, 0, 2)
-    elif dim_format == "XYTZC":
-        if size_t == 1:
-            array = np.expand_dims(array, axis=-3)
-        if size_z == 1:
-            array = np.expand_dims(array, axis=-4)
-        if size_c == 1:
-            array = np.expand_dims(array, axis=-5)
-        array = np.moveaxis(array, 0, 2)
-        array = np.moveaxis(array, 0, 1)
-    elif dim_format == "XYTCZ":
-        if size_t == 1:
-            array = np.expand_dims(array, axis=-3)
-        if size_c == 1:
-            array = np.expand_dims(array, axis=-4)
-        if size_z == 1:
-            array = np.expand_dims(array, axis=-5)
-        array = np.moveaxis(array, 1, 2)
-        array = np.moveaxis(array, 0, 1)
-    else:
-        print(array.shape)
-        raise Exception("Unknow dimension format")
+    @property
+    def shape(self) -> Tuple[int, int, int, int, int]:
+        return self._shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._dtype
+
+    @property
+    def ndim(self) -> int:
+        return len(self._shape)
+
+    def __len__(self) -> int:
+        return self._shape[0]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(shape={self._shape}, dtype={self._dtype}, level={self._level})"
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        if copy is False:
+            raise ValueError("OmeTiffArray is read from the file, it cannot be converted to an array without a copy")
+        # every read returns a new array, so no further copy is needed for copy=True
+        array, omexml_string = self._file.read(level=self._level)
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+    def __getitem__(self, key) -> np.ndarray:
+        key = _expand_index(key, self.ndim)
+        planes = [_selection_indices(selection, size) for selection, size in zip(key[:3], self._shape[:3])]
+        window = []
+        for selection, size in zip(key[3:], self._shape[3:]):
+            if isinstance(selection, (int, np.integer)):
+                start = range(size)[selection]
+                selection = slice(start, start + 1)
+            elif not isinstance(selection, slice):
+                raise IndexError("Y and X can only be indexed with ints and slices")
+            window.append(selection)
+        y, x = window
+
+        window_shape = tuple(len(range(size)[selection]) for selection, size in zip(window, self._shape[3:]))
+        array = np.empty(tuple(len(indices) for indices in planes) + window_shape, dtype=self._dtype)
+        for index in np.ndindex(array.shape[:3]):
+            t, z, c = (planes[axis][index[axis]] for axis in range(3))
+            array[index] = self._file.read_region(t, z, c, y, x, level=self._level)
+        # ints drop their dimension, as in numpy
+        return array[tuple(0 if isinstance(selection, (int, np.integer)) else slice(None) for selection in key)]
+
+
+def _expand_index(key, ndim):
+    """Expand a numpy-style index with an optional Ellipsis to one entry per dimension"""
+    if not isinstance(key, tuple):
+        key = (key,)
+    if any(selection is None for selection in key):
+        raise IndexError("Adding dimensions with None is not supported")
+    ellipses = [index for index, selection in enumerate(key) if selection is Ellipsis]
+    if len(ellipses) > 1:
+        raise IndexError("An index can only have a single ellipsis")
+    if ellipses:
+        position = ellipses[0]
+        fill = (slice(None),) * (ndim - len(key) + 1)
+        key = key[:position] + fill + key[position + 1:]
+    if len(key) > ndim:
+        raise IndexError(f"Too many indices for array: array is {ndim}-dimensional")
+    return key + (slice(None),) * (ndim - len(key))
+
+
+class _TiffFilePool:
+    """LRU-bounded pool of open TiffFile handles, the least recently used file is closed first"""
+
+    def __init__(self, max_open_files: int):
+        if max_open_files < 1:
+            raise ValueError(f"max_open_files must be at least 1, got {max_open_files}")
+        self._max_open_files = max_open_files
+        self._tiff_files = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._tiff_files)
+
+    def get(self, path: Path) -> tifffile.TiffFile:
+        if path in self._tiff_files:
+            self._tiff_files.move_to_end(path)
+            return self._tiff_files[path]
+        tiff_file = tifffile.TiffFile(path)
+        self._tiff_files[path] = tiff_file
+        while len(self._tiff_files) > self._max_open_files:
+            self._tiff_files.popitem(last=False)[1].close()
+        return tiff_file
+
+    def close(self) -> None:
+        for tiff_file in self._tiff_files.values():
+            tiff_file.close()
+        self._tiff_files.clear()
+
+
+class OmeTiffDataset:
+    """
+    OME-TIFF dataset whose planes are split across several files
+
+    The OME-XML is read from the file at path. Its TiffData elements reference the file holding
+    each plane through the FileName attribute of their UUID child, relative to the directory of
+    path. Planes without one are stored in the file at path itself. Member files are opened
+    lazily when their planes are read, at most max_open_files of them at once.
+    """
+
+    def __init__(self, path: PathLike, max_open_files: int = 32):
+        self._path = Path(path)
+        with tifffile.TiffFile(self._path) as tiff_file:
+            self._omexml_string = tiff_file.ome_metadata
+        if self._omexml_string is None:
+            raise ValueError(f"{path} does not contain OME-XML metadata")
+        metadata = omexmlClass.OMEXML(self._omexml_string)
+
+        self._images = []
+        self._file_maps = []
+        for node in metadata.root_node.findall(omexmlClass.qn(metadata.ns["ome"], "Image")):
+            pixels = omexmlClass.OMEXML.Image(node).Pixels
+            self._images.append(ImageSummary(pixels))
+            self._file_maps.append(_get_plane_map(pixels)[1])
+        self._pool = _TiffFilePool(max_open_files)
+
+    def __enter__(self) -> "OmeTiffDataset":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> bool:
+        self.close()
+        return False
+
+    def close(self) -> None:
+        self._pool.close()
+
+    @property
+    def images(self) -> Tuple[ImageSummary, ...]:
+        """Dimension summaries of all images (= series) in the dataset"""
+        return tuple(self._images)
+
+    @property
+    def files(self) -> List[Path]:
+        """Paths of all files holding planes of the dataset"""
+        file_names = {name for file_map in self._file_maps for name in file_map.flat}
+        return sorted(self._resolve(name) for name in file_names)
+
+    def _resolve(self, file_name: Optional[str]) -> Path:
+        return self._path if file_name is None else self._path.parent / file_name
+
+    def read_plane(self, t: int = 0, z: int = 0, c: int = 0, image: int = 0) -> np.ndarray:
+        """Read a single YX plane, opening only the file that holds it"""
+        summary = self._images[image]
+        ifd = summary.ifd_map[t, z, c]
+        if ifd < 0:
+            raise ValueError(f"Plane (t={t}, z={z}, c={c}) is not stored in this dataset")
+        page = self._pool.get(self._resolve(self._file_maps[image][t, z, c])).pages[int(ifd)]
+        return _select_sample(page.asarray(), summary, c, page.planarconfig == 2)
+
+    def read(
+        self,
+        t: PlaneSelection = None,
+        z: PlaneSelection = None,
+        c: PlaneSelection = None,
+        image: int = 0,
+        axes: str = "TZCYX",
+    ) -> Tuple[np.ndarray, str]:
+        """
+        Assemble an image of the dataset as a 5D array in TZCYX order by default
+
+        Parameters
+        ----------
+        t, z, c : Optional[int, slice or sequence of int]
+            Planes to read along the T, Z and C dimensions, see OmeTiffFile.read. Only the files
+            holding the selected planes are opened.
+        image : int
+            Index of the image (= series) to read.
+        axes : str
+            Order of the dimensions of the returned array, see OmeTiffFile.read.
+        """
+        summary = self._images[image]
+        indices = [
+            _selection_indices(selection, size)
+            for selection, size in zip((t, z, c), summary.ifd_map.shape)
+        ]
+        ifds = summary.ifd_map[np.ix_(*indices)]
+        if (ifds < 0).any():
+            raise ValueError("Selection contains planes that are not stored in this dataset")
+        files = self._file_maps[image][np.ix_(*indices)]
+
+        # planes are read file by file, so that each file is opened once with a small pool
+        planes = sorted(
+            np.ndindex(ifds.shape), key=lambda index: (str(self._resolve(files[index])), ifds[index])
+        )
+        array = None
+        for index in planes:
+            plane = self.read_plane(*(indices[axis][index[axis]] for axis in range(3)), image=image)
+            if array is None:
+                array = np.empty(ifds.shape + plane.shape, dtype=plane.dtype)
+            array[index] = plane
+        if array is None:
+            dtype = self._pool.get(self._path).pages[0].dtype
+            array = np.empty(ifds.shape + (summary.size_y, summary.size_x), dtype=dtype)
+        return _transpose_axes(array, axes), self._omexml_string
+
+
+def _selection_indices(selection, size):
+    """Turn an int, slice, sequence or None into a list of plane indices along one dimension"""
+    if selection is None:
+        return list(range(size))
+    if isinstance(selection, slice):
+        return list(range(size)[selection])
+    if isinstance(selection, (int, np.integer)):
+        return [range(size)[selection]]
+    return [range(size)[index] for index in selection]
+
+
+def _select_planes(array, t, z, c):
+    """Apply plane selections to the TZC axes of a 5D array, keeping views where possible"""
+    for axis, selection in enumerate((t, z, c)):
+        if selection is None:
+            continue
+        if isinstance(selection, (int, np.integer)):
+            index = range(array.shape[axis])[selection]
+            selection = slice(index, index + 1)
+        elif not isinstance(selection, slice):
+            selection = list(selection)
+        array = array[(slice(None),) * axis + (selection,)]
     return array
 
 
+def _select_sample(plane, image, c, planar_separate):
+    """Return the sample of a decoded IFD of image that holds channel c"""
+    if image.samples_per_pixel == 1:
+        return plane
+    sample = range(image.size_c)[c] % image.samples_per_pixel
+    return plane[sample] if planar_separate else plane[..., sample]
+
+
+def _read_page_region(page, y, x):
+    """Read a YX window of a TIFF page, decoding only the strips or tiles overlapping it"""
+    rows = range(*y.indices(page.imagelength))
+    columns = range(*x.indices(page.imagewidth))
+    samples = page.samplesperpixel
+    if samples > 1 and page.planarconfig != 1:
+        raise ValueError("Region reads of planar separate images are not supported")
+    sample_shape = (samples,) if samples > 1 else ()
+    if not rows or not columns:
+        return np.empty((len(rows), len(columns)) + sample_shape, dtype=page.dtype)
+
+    # bounding window of the selection, steps are applied once the window is read
+    y_start, y_stop = min(rows), max(rows) + 1
+    x_start, x_stop = min(columns), max(columns) + 1
+    window = np.empty((y_stop - y_start, x_stop - x_start, samples), dtype=page.dtype)
+
+    fh = page.parent.filehandle
+    if page.is_final:
+        # uncompressed contiguous data, read the rows of the window only
+        row_size = page.imagewidth * samples
+        with fh.lock:
+            fh.seek(page.dataoffsets[0] + y_start * row_size * page.dtype.itemsize)
+            rows_data = fh.read_array(
+                page.parent.byteorder + page.dtype.char, (y_stop - y_start) * row_size
+            )
+        rows_data.shape = (y_stop - y_start, page.imagewidth, samples)
+        window[:] = rows_data[:, x_start:x_stop]
+    else:
+        if page.is_tiled:
+            segment_length, segment_width = page.tilelength, page.tilewidth
+        else:
+            segment_length, segment_width = page.rowsperstrip, page.imagewidth
+        segments_per_row = -(-page.imagewidth // segment_width)
+        indices = [
+            segment_row * segments_per_row + segment_column
+            for segment_row in range(y_start // segment_length, (y_stop - 1) // segment_length + 1)
+            for segment_column in range(x_start // segment_width, (x_stop - 1) // segment_width + 1)
+        ]
+        segments = []
+        with fh.lock:
+            for index in indices:
+                offset, bytecount = page.dataoffsets[index], page.databytecounts[index]
+                if offset > 0 and bytecount > 0:
+                    fh.seek(offset)
+                    segments.append((fh.read(bytecount), index))
+                else:
+                    segments.append((None, index))
+
+        decode = page.decode
+        for data, index in segments:
+            segment, (_, _, length_start, width_start, _), shape = decode(data, index)
+            top, bottom = max(y_start, length_start), min(y_stop, length_start + shape[1])
+            left, right = max(x_start, width_start), min(x_stop, width_start + shape[2])
+            target = window[top - y_start:bottom - y_start, left - x_start:right - x_start]
+            if segment is None:
+                target[:] = page.nodata
+            else:
+                target[:] = segment[
+                    0, top - length_start:bottom - length_start, left - width_start:right - width_start
+                ]
+
+    window = window[::rows.step, ::columns.step]
+    return window if samples > 1 else window[..., 0]
+
+
+def _get_samples_per_pixel(pixels):
+    """Return the number of samples per IFD, taken from the first Channel (default 1)"""
+    channel = pixels.node.find(omexmlClass.qn(pixels.ns["ome"], "Channel"))
+    if channel is None:
+        return 1
+    return int(channel.get("SamplesPerPixel", 1))
+
+
+def _get_ifd_map(pixels, local_files=None):
+    """
+    Return an array of shape (SizeT, SizeZ, SizeC) holding the IFD of every plane
+
+    The IFDs are taken from the TiffData elements of the given Pixels. Planes without a TiffData
+    entry are marked with -1. If there are no TiffData elements at all, the planes are assumed to be
+    stored one per IFD in DimensionOrder. With SamplesPerPixel > 1, the samples of an IFD are
+    consecutive channels, which share its IFD. If local_files is given, planes whose TiffData has a
+    UUID child matching none of its UUIDs and file names are stored in another file and marked
+    with -1 as well.
+    """
+    return _get_plane_map(pixels, local_files)[0]
+
+
+def _get_plane_map(pixels, local_files=None):
+    """
+    Return the IFD map of pixels (see _get_ifd_map) and an object array of the same shape holding
+    the file of every plane
+
+    Files are given by the FileName attribute of the UUID child of the TiffData elements, planes
+    without one are stored in the file holding the OME-XML and marked with None.
+    """
+    samples_per_pixel = _get_samples_per_pixel(pixels)
+    sizes = {"T": pixels.SizeT, "Z": pixels.SizeZ, "C": pixels.SizeC // samples_per_pixel}
+    # e.g. XYCZT -> TZC, the slowest varying dimension first
+    plane_dims = pixels.DimensionOrder[:1:-1]
+    shape = tuple(sizes[dim] for dim in plane_dims)
+    plane_count = int(np.prod(shape))
+
+    tiff_datas = pixels.node.findall(omexmlClass.qn(pixels.ns["ome"], "TiffData"))
+    files = np.full(plane_count, None, dtype=object)
+    if not tiff_datas:
+        ifds = np.arange(plane_count)
+    else:
+        ifds = np.full(plane_count, -1)
+        for node in tiff_datas:
+            tiff_data = omexmlClass.OMEXML.TiffData(node)
+            first = [int(node.get("First" + dim, 0)) for dim in plane_dims]
+            start = int(np.ravel_multi_index(first, shape))
+            ifd = tiff_data.IFD or 0
+            count = tiff_data.PlaneCount
+            if count is None:
+                # as in the OME-TIFF specification, a lone IFD attribute means a single plane
+                count = 1 if tiff_data.IFD is not None else plane_count - start
+            count = min(count, plane_count - start)
+            uuid = node.find(omexmlClass.qn(pixels.ns["ome"], "UUID"))
+            if (local_files is not None and uuid is not None
+                    and (uuid.text or "").strip() not in local_files
+                    and uuid.get("FileName") not in local_files):
+                ifds[start:start + count] = -1
+            else:
+                ifds[start:start + count] = np.arange(ifd, ifd + count)
+            files[start:start + count] = None if uuid is None else uuid.get("FileName")
+
+    axes = [plane_dims.index(dim) for dim in "TZC"]
+    return tuple(
+        np.repeat(np.transpose(plane_map.reshape(shape), axes), samples_per_pixel, axis=2)
+        for plane_map in (ifds, files)
+    )
+
+
+def _ensure_correct_dimensions(array, image, planar_separate=False, size_yx=None):
+    """
+    Return the pixel data of an image, stored in DimensionOrder, as a 5D TZCYX array
+
+    The array is reshaped to the full file order, e.g. (C, Z, T, Y, X) planes for XYCZT plus an
+    axis for the samples of every IFD, and then transposed. This is a view of the pixel data unless
+    SamplesPerPixel > 1 is stored interleaved in more than one IFD per T and Z, in which case the
+    samples cannot be merged into the C axis without copying. size_yx defaults to the size of the
+    full resolution image and has to be given for pyramid levels.
+    """
+    order = image.dimension_order
+    if order[:2] != "XY" or sorted(order[2:]) != ["C", "T", "Z"]:
+        raise ValueError(f"Unknown dimension order {order!r}")
+    samples_per_pixel = image.samples_per_pixel
+    sizes = {"T": image.size_t, "Z": image.size_z, "C": image.size_c // samples_per_pixel}
+    size_y, size_x = size_yx or (image.size_y, image.size_x)
+
+    # e.g. XYCZT -> TZC, the slowest varying dimension first
+    file_axes = order[:1:-1]
+    shape = [sizes[dim] for dim in file_axes]
+    if planar_separate:
+        file_axes += "SYX"
+        shape += [samples_per_pixel, size_y, size_x]
+    else:
+        file_axes += "YXS"
+        shape += [size_y, size_x, samples_per_pixel]
+    array = array.reshape(shape)
+
+    array = np.transpose(array, [file_axes.index(dim) for dim in "TZCSYX"])
+    return array.reshape(array.shape[:2] + (image.size_c,) + array.shape[-2:])
+
+
+def _transpose_axes(array, axes):
+    """
+    Reorder a 5D TZCYX array to the given axes, e.g. "TCZYX" or "ZYX", as a view
+
+    Dimensions not listed in axes are dropped and must have a size of 1.
+    """
+    if len(set(axes)) != len(axes) or not set(axes) <= set("TZCYX"):
+        raise ValueError(f"Invalid axes {axes!r}, expected a subset of 'TZCYX'")
+    if axes == "TZCYX":
+        return array
+    index = []
+    for dim, size in zip("TZCYX", array.shape):
+        if dim in axes:
+            index.append(slice(None))
+        elif size == 1:
+            index.append(0)
+        else:
+            raise ValueError(f"Cannot drop dimension {dim} of size {size} for axes {axes!r}")
+    kept = [dim for dim in "TZCYX" if dim in axes]
+    return np.transpose(array[tuple(index)], [kept.index(dim) for dim in axes])
+
+
 def update_xml(omexml, Image_ID=None, Image_Name=None, Image_AcquisitionDate=None,
                DimensionOrder=None, dType=None, SizeT=None, SizeZ=None, SizeC=None, SizeX=None, SizeY=None,
                 Channel_ID=None, Channel_Name=None, Channel_SamplesPerPixel=None):
@@ -172,20 +924,31 @@ def update_xml(omexml, Image_ID=None, Image_Name=None, Image_AcquisitionDate=Non
 
 
 def gen_xml(array):
+    return _gen_omexml(array.shape, array.dtype).to_xml().encode()
+
+
+def _gen_omexml(shape, dtype, omexml_string=None):
+    """
+    OME-XML of a TZCYX image of the given shape and dtype, stored as one plane per IFD
+
+    If omexml_string is given, the first image of it is updated instead, keeping e.g. its channel
+    names, physical sizes and the metadata of planes that are still within the new sizes.
+    """
 
     #Dimension order is assumed to be TZCYX
     dim_order = "TZCYX"
 
-    metadata = omexmlClass.OMEXML()
-    shape = array.shape
     assert ( len(shape) == 5), "Expected array of 5 dimensions"
-
-    metadata.image().set_Name("IMAGE")
-    metadata.image().set_ID("0")
-
-    pixels = metadata.image().Pixels
-    pixels.ome_uuid = metadata.uuidStr
-    pixels.set_ID("0")
+    if omexml_string is None:
+        metadata = omexmlClass.OMEXML()
+        metadata.image().set_Name("IMAGE")
+        metadata.image().set_ID("0")
+        pixels = metadata.image().Pixels
+        pixels.ome_uuid = metadata.uuidStr
+        pixels.set_ID("0")
+    else:
+        metadata = _base_omexml(omexml_string, shape)
+        pixels = metadata.image().Pixels
 
     pixels.channel_count = shape[2]
 
@@ -197,22 +960,101 @@ def gen_xml(array):
 
     pixels.set_DimensionOrder(dim_order[::-1])
 
-    pixels.set_PixelType(omexmlClass.get_pixel_type(array.dtype))
+    pixels.set_PixelType(omexmlClass.get_pixel_type(dtype))
 
-    for i in range(pixels.SizeC):
-        pixels.Channel(i).set_ID("Channel:0:" + str(i))
-        pixels.Channel(i).set_Name("C:" + str(i))
+    if omexml_string is None:
+        for i in range(pixels.SizeC):
+            pixels.Channel(i).set_ID("Channel:0:" + str(i))
+            pixels.Channel(i).set_Name("C:" + str(i))
 
     for i in range(pixels.SizeC):
         pixels.Channel(i).set_SamplesPerPixel(1)
 
-    pixels.populate_TiffData()
+    pixels.populate_TiffData(compact=True)
+
+    return metadata
+
+
+def _base_omexml(omexml_string, shape):
+    """Parse omexml_string as a new file holding only its first image, with planes outside shape removed"""
+    metadata = omexmlClass.OMEXML(omexml_string)
+    root = metadata.root_node
+    root.set("UUID", "urn:uuid:" + str(uuid.uuid4()))
+    metadata.uuidStr = root.get("UUID")
+    for image_node in root.findall(omexmlClass.qn(metadata.ns["ome"], "Image"))[1:]:
+        root.remove(image_node)
+
+    pixels = metadata.image().Pixels
+    pixels.ome_uuid = metadata.uuidStr
+    size_t, size_z, size_c = shape[:3]
+    for node in pixels.node.findall(omexmlClass.qn(metadata.ns["ome"], "Plane")):
+        plane = omexmlClass.OMEXML.Plane(node)
+        if (plane.TheT or 0) >= size_t or (plane.TheZ or 0) >= size_z or (plane.TheC or 0) >= size_c:
+            pixels.node.remove(node)
+    omexmlClass.invalidate_node_indexes(pixels.node)
+    return metadata
+
+
+def _set_tiff_data(pixels, ifd_map, file_map=None, files=()):
+    """
+    Replace the TiffData elements of pixels by the planes stored in the (T, Z, C) IFD map
 
-    return metadata.to_xml().encode()
+    Runs of planes that follow each other both in DimensionOrder and in consecutive IFDs of the same
+    file share a single TiffData element with a PlaneCount, so planes written in DimensionOrder need
+    only one. For planes split across several files, file_map holds the index of the file of every
+    plane into files, a sequence of (FileName, UUID) pairs referenced by the UUID child of the
+    TiffData.
+    """
+    for node in pixels.node.findall(omexmlClass.qn(pixels.ns["ome"], "TiffData")):
+        pixels.node.remove(node)
+    stored = ifd_map >= 0
+    planes = np.argwhere(stored)
+    ifds = ifd_map[stored]
+    plane_files = np.zeros_like(ifds) if file_map is None else file_map[stored]
+    order = np.lexsort((ifds, plane_files))
+    planes, ifds, plane_files = planes[order], ifds[order], plane_files[order]
+
+    # position of every plane in DimensionOrder, e.g. XYCZT -> TZC, the slowest varying first
+    plane_dims = pixels.DimensionOrder[:1:-1]
+    positions = np.ravel_multi_index(
+        tuple(planes[:, "TZC".index(dim)] for dim in plane_dims),
+        tuple(ifd_map.shape["TZC".index(dim)] for dim in plane_dims),
+    )
+    run_starts = np.flatnonzero(
+        (np.diff(positions, prepend=-2) != 1)
+        | (np.diff(ifds, prepend=-2) != 1)
+        | (np.diff(plane_files, prepend=-1) != 0)
+    )
+    run_stops = np.append(run_starts[1:], len(planes))
+
+    for start, stop in zip(run_starts, run_stops):
+        t, z, c = planes[start]
+        tiff_data = omexmlClass.OMEXML.TiffData(
+            omexmlClass.ElementTree.SubElement(pixels.node, omexmlClass.qn(pixels.ns["ome"], "TiffData"))
+        )
+        tiff_data.set_FirstT(t)
+        tiff_data.set_FirstZ(z)
+        tiff_data.set_FirstC(c)
+        tiff_data.set_IFD(ifds[start])
+        tiff_data.set_PlaneCount(stop - start)
+        if file_map is not None:
+            file_name, file_uuid = files[plane_files[start]]
+            uuid_node = omexmlClass.ElementTree.SubElement(
+                tiff_data.node, omexmlClass.qn(pixels.ns["ome"], "UUID")
+            )
+            uuid_node.set("FileName", file_name)
+            uuid_node.text = file_uuid
+
+
+def _requires_bigtiff(data_nbytes):
+    data_limit_nbytes = 2 ** 32
+    tiff_metadata_nbytes = 2 ** 25
+    return data_nbytes > data_limit_nbytes - tiff_metadata_nbytes
 
 
 
-def write_ometiff(output_path, array, omexml_string = None, compression=None):
+def write_ometiff(output_path, array, omexml_string = None, compression=None, tile=None, pyramid_levels=0,
+                  max_workers=None, split_by=None, max_processes=None):
     """
     Write the given 5D array as an ome.tiff
 
@@ -226,13 +1068,241 @@ def write_ometiff(output_path, array, omexml_string = None, compression=None):
         encoded XML Metadata, will be generated if not provided.
     compression : str
         possible values listed here:
-        https://github.com/cgohlke/tifffile/blob/f55fc8a49c2ad30697a6b1760d5a325533574ad8/tifffile/tifffile.py#L12131
+        https://github.com/cgohlke/tifffile/blob/v2022.5.4/tifffile/tifffile.py#L13359
+    tile : Optional[Tuple[int, int]]
+        (length, width) of the tiles the planes are split into, both must be a multiple of 16.
+        Each tile is compressed independently, which allows reading regions of a plane without
+        decoding all of it. By default, planes are written in strips.
+    pyramid_levels : int
+        Number of sub-resolution levels to write as SubIFDs of every plane, following the OME-TIFF
+        pyramid convention. Level k is downsampled by a factor of 2**k in Y and X, computed plane by
+        plane from the full resolution data.
+    max_workers : Optional[int]
+        Number of threads used to compress the strips or tiles of a plane. The codecs release the
+        GIL, and the compressed segments are written in file order regardless of the thread count.
+        By default, up to half of the CPU cores are used. 1 disables multi-threading.
+    split_by : Optional[str]
+        "T", "Z" or "C" to write one file per index of that dimension instead of a single file, e.g.
+        "image.ome.tiff" is split into "image_T0.ome.tiff", "image_T1.ome.tiff", ... Every file
+        carries the full OME-XML, whose TiffData elements reference the files by UUID and FileName,
+        so that any of them can be opened with OmeTiffDataset.
+    max_processes : Optional[int]
+        Number of worker processes writing the files of split_by concurrently, each process receives
+        a copy of its part of the array. By default, one per CPU core. 1 writes the files serially.
+
+    Returns
+    -------
+    Optional[List[str]]
+        Paths of the written files if split_by is given.
     """
     if omexml_string is None:
         omexml_string = gen_xml(array)
+    if split_by is not None:
+        return _write_split_ometiff(
+            output_path, array, omexml_string, split_by, max_processes,
+            compression=compression, tile=tile, pyramid_levels=pyramid_levels, max_workers=max_workers,
+        )
 
-    data_limit_nbytes = 2 ** 32
-    tiff_metadata_nbytes = 2 ** 25
-    bigtiff = array.nbytes > data_limit_nbytes - tiff_metadata_nbytes
-    tifffile.imwrite(output_path, array, photometric="minisblack", description=omexml_string, metadata=None,
-                     compress=compression, bigtiff=bigtiff)
+    # every pyramid level adds at most a quarter of the previous level
+    bigtiff = _requires_bigtiff(array.nbytes * (4 - 4 ** -pyramid_levels) / 3)
+
+    n_t, n_z, n_c, size_y, size_x = array.shape
+    with tifffile.TiffWriter(output_path, bigtiff=bigtiff) as tiff_writer:
+        tiff_writer.write(array, photometric="minisblack", description=omexml_string, metadata=None,
+                          compression=compression, tile=tile, subifds=pyramid_levels or None,
+                          maxworkers=max_workers)
+        for level in range(1, pyramid_levels + 1):
+            factor = 2 ** level
+            level_shape = (n_t * n_z * n_c, -(-size_y // factor), -(-size_x // factor))
+            # index the planes rather than reshaping, which would copy a non-contiguous array
+            planes = (_downsample_plane(array[t, z, c], factor) for t, z, c in np.ndindex(array.shape[:3]))
+            tiff_writer.write(_iter_tiles(planes, tile) if tile else planes, shape=level_shape,
+                              dtype=array.dtype, photometric="minisblack", metadata=None,
+                              compression=compression, tile=tile, subfiletype=1, maxworkers=max_workers)
+
+
+def _split_paths(output_path, dim, count):
+    """Return the paths of the files output_path is split into along dim, e.g. image_T0.ome.tiff"""
+    path = Path(output_path)
+    name = path.name
+    suffix = next((ext for ext in (".ome.tiff", ".ome.tif") if name.lower().endswith(ext)), path.suffix)
+    stem = name[:len(name) - len(suffix)]
+    width = len(str(count - 1))
+    return [str(path.with_name(f"{stem}_{dim}{index:0{width}d}{suffix}")) for index in range(count)]
+
+
+def _write_split_ometiff(output_path, array, omexml_string, split_by, max_processes, **kwargs):
+    """Write array as one OME-TIFF file per index along split_by, see write_ometiff"""
+    if split_by not in ("T", "Z", "C"):
+        raise ValueError(f"Unknown split_by {split_by!r}, expected 'T', 'Z' or 'C'")
+    axis = "TZC".index(split_by)
+    paths = _split_paths(output_path, split_by, array.shape[axis])
+    files = [(Path(path).name, "urn:uuid:" + str(uuid.uuid4())) for path in paths]
+
+    # planes are stored in TZC order within every file
+    plane_shape = array.shape[:3]
+    file_plane_shape = tuple(1 if dim == axis else size for dim, size in enumerate(plane_shape))
+    ifd_map = np.broadcast_to(
+        np.arange(int(np.prod(file_plane_shape))).reshape(file_plane_shape), plane_shape
+    )
+    file_map = np.indices(plane_shape)[axis]
+
+    metadata = omexmlClass.OMEXML(omexml_string)
+    _set_tiff_data(metadata.image().Pixels, ifd_map, file_map, files)
+    jobs = []
+    for index, (path, (file_name, file_uuid)) in enumerate(zip(paths, files)):
+        metadata.root_node.set("UUID", file_uuid)
+        part = array[(slice(None),) * axis + (slice(index, index + 1),)]
+        jobs.append((path, part, metadata.to_xml().encode()))
+
+    if max_processes == 1 or len(jobs) == 1:
+        for path, part, file_omexml_string in jobs:
+            write_ometiff(path, part, file_omexml_string, **kwargs)
+    else:
+        with ProcessPoolExecutor(max_processes) as executor:
+            futures = [
+                executor.submit(write_ometiff, path, part, file_omexml_string, **kwargs)
+                for path, part, file_omexml_string in jobs
+            ]
+            for future in futures:
+                future.result()
+    return paths
+
+
+def _downsample_plane(plane, factor):
+    """Downsample a YX plane by averaging factor x factor blocks, edge blocks are padded by replication"""
+    size_y, size_x = plane.shape
+    pad_y, pad_x = -size_y % factor, -size_x % factor
+    if pad_y or pad_x:
+        plane = np.pad(plane, ((0, pad_y), (0, pad_x)), mode="edge")
+    blocks = plane.reshape(plane.shape[0] // factor, factor, plane.shape[1] // factor, factor)
+    downsampled = blocks.mean(axis=(1, 3))
+    if np.issubdtype(plane.dtype, np.integer):
+        downsampled = np.rint(downsampled)
+    return downsampled.astype(plane.dtype)
+
+
+def _iter_tiles(planes, tile):
+    """Split YX planes into the tiles tifffile expects when writing from an iterator"""
+    tile_y, tile_x = tile
+    for plane in planes:
+        for y in range(0, plane.shape[0], tile_y):
+            for x in range(0, plane.shape[1], tile_x):
+                yield plane[y:y + tile_y, x:x + tile_x]
+
+
+class OmeTiffWriter:
+    """
+    Write an ome.tiff plane by plane, e.g. from an acquisition loop
+
+    Shape and dtype of the image are given up front. Every plane is written to its own IFD as soon
+    as it arrives, so the full 5D array never has to be in memory. Planes may arrive in any order,
+    the OME-XML generated by gen_xml is finalised with the IFD of every written plane on close.
+    Closing a writer that received no planes raises ValueError, as a TIFF file without pages is not
+    a valid ome.tiff.
+
+    >>> with OmeTiffWriter("out.ome.tiff", shape=(10, 5, 2, 512, 512), dtype=np.uint16) as writer:
+    ...     for t, zstack in enumerate(acquire_zstacks()):
+    ...         writer.write_zstack(zstack, t=t, c=0)
+    """
+
+    def __init__(
+        self,
+        output_path: PathLike,
+        shape: Tuple[int, int, int, int, int],
+        dtype: np.dtype,
+        compression=None,
+        tile: Optional[Tuple[int, int]] = None,
+        max_workers: Optional[int] = None,
+        omexml_string=None,
+    ):
+        """
+        Parameters
+        ----------
+        output_path : str
+            Path where to save the ome.tiff
+        shape : Tuple[int, int, int, int, int]
+            Shape of the image in TZCYX order
+        dtype : np.dtype
+            Data type of the planes
+        compression, tile, max_workers :
+            See write_ometiff
+        omexml_string : Optional[encoded xml]
+            Metadata to base the OME-XML on instead of gen_xml, e.g. that of the file the planes are
+            derived from. Only its first image is kept, with the sizes, pixel type and channel count
+            updated to shape and dtype and the TiffData elements replaced.
+        """
+        self._shape = tuple(shape)
+        self._dtype = np.dtype(dtype)
+        self._compression = compression
+        self._tile = tile
+        self._max_workers = max_workers
+        self._metadata = _gen_omexml(self._shape, self._dtype, omexml_string)
+        self._ifd_map = np.full(self._shape[:3], -1)
+        self._ifd_count = 0
+        self._closed = False
+        data_nbytes = int(np.prod(self._shape)) * self._dtype.itemsize
+        self._tiff_writer = tifffile.TiffWriter(output_path, bigtiff=_requires_bigtiff(data_nbytes))
+
+    def __enter__(self) -> "OmeTiffWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> bool:
+        if exc_type is None:
+            self.close()
+        else:
+            # keep the planes written before the error readable, without masking the error
+            self._finalise()
+        return False
+
+    def close(self) -> None:
+        """
+        Write the final OME-XML, referencing all planes written so far, and close the file
+
+        Further calls do nothing. Raises ValueError if no plane was written.
+        """
+        if self._closed:
+            return
+        self._finalise()
+        if not self._ifd_count:
+            raise ValueError("No planes were written, the file is not a valid ome.tiff")
+
+    def _finalise(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._ifd_count:
+            pixels = self._metadata.image().Pixels
+            _set_tiff_data(pixels, self._ifd_map)
+            self._tiff_writer.overwrite_description(self._metadata.to_xml().encode())
+        self._tiff_writer.close()
+
+    def write_plane(self, plane: np.ndarray, t: int, z: int, c: int) -> None:
+        """Write a single YX plane at index (t, z, c)"""
+        plane = np.asarray(plane)
+        if plane.shape != self._shape[3:] or plane.dtype != self._dtype:
+            raise ValueError(
+                f"Expected plane of shape {self._shape[3:]} and dtype {self._dtype}, "
+                f"got {plane.shape} and {plane.dtype}"
+            )
+        if self._ifd_map[t, z, c] >= 0:
+            raise ValueError(f"Plane (t={t}, z={z}, c={c}) has already been written")
+
+        # the first IFD carries the OME-XML, which is overwritten on close
+        description = self._metadata.to_xml().encode() if self._ifd_count == 0 else None
+        self._tiff_writer.write(plane, photometric="minisblack", description=description, metadata=None,
+                                compression=self._compression, tile=self._tile, maxworkers=self._max_workers)
+        self._ifd_map[t, z, c] = self._ifd_count
+        self._ifd_count += 1
+
+    def write_zstack(self, zstack: np.ndarray, t: int, c: int) -> None:
+        """Write a ZYX stack at index (t, c)"""
+        if len(zstack) != self._shape[1]:
+            raise ValueError(f"Expected Z-stack of {self._shape[1]} planes, got {len(zstack)}")
+        for z, plane in enumerate(zstack):
+            self.write_plane(plane, t, z, c)
@@ -16,6 +16,7 @@ import logging
 import re
 import sys
 import uuid
+import weakref
 import xml.etree.ElementTree as ElementTree
 from functools import reduce
 from io import BytesIO
@@ -96,6 +97,21 @@ def get_pixel_type(npdtype):
     return ptype
 
 
+#
+# Columns of Pixels.planes_table, absent float attributes are NaN
+#
+PLANES_TABLE_DTYPE = np.dtype([
+    ("TheZ", np.int32),
+    ("TheC", np.int32),
+    ("TheT", np.int32),
+    ("DeltaT", np.float64),
+    ("ExposureTime", np.float64),
+    ("PositionX", np.float64),
+    ("PositionY", np.float64),
+    ("PositionZ", np.float64),
+])
+
+
 #
 # The allowed dimension types
 #
@@ -284,6 +300,121 @@ def get_int_attr(node, attribute):
     return None if attr is None else int(attr)
 
 
+class _NodeIndex(object):
+    """Base class of indexes over the children of an element, see get_node_index"""
+    def __init__(self, node):
+        self.child_count = len(node)
+        self.first_child = node[0] if len(node) else None
+        self.last_child = node[-1] if len(node) else None
+
+    def is_current(self, node):
+        """Whether node still has the children the index was built from, as far as cheaply known"""
+        if len(node) != self.child_count:
+            return False
+        return not len(node) or (node[0] is self.first_child and node[-1] is self.last_child)
+
+
+class _ChildIndex(_NodeIndex):
+    """Children of an element grouped by tag, and its Plane children by (TheZ, TheC, TheT)"""
+    def __init__(self, node):
+        super(_ChildIndex, self).__init__(node)
+        self.children = {}
+        for child in node:
+            self.children.setdefault(child.tag, []).append(child)
+        self.planes = None
+        self.planes_generation = None
+
+
+class _AnnotationIndex(_NodeIndex):
+    """Annotations of a StructuredAnnotations element by ID, and its original metadata by key"""
+    def __init__(self, node):
+        super(_AnnotationIndex, self).__init__(node)
+        self.ids = {}
+        for child in node:
+            self.ids.setdefault(child.get("ID"), child)
+        self.values = {}
+        # (position, key, value) of the original metadata of every annotation, in document order
+        self.original_metadata = {}
+        for position, (annotation_id, (key, value)) in enumerate(
+                iter_original_metadata(node, get_namespaces(node))):
+            self.values.setdefault(key, value)
+            self.original_metadata.setdefault(annotation_id, []).append((position, key, value))
+
+
+# indexes are cached per element rather than per wrapper, as wrappers are created on every access
+_node_indexes = weakref.WeakKeyDictionary()
+
+
+def get_node_index(node, index_class):
+    """Return the cached index_class index of node, rebuilt if children were added or removed
+
+    Changes deeper in the tree, e.g. to the Key of an OriginalMetadata, are not detected, call
+    invalidate_node_indexes after making them.
+    """
+    indexes = _node_indexes.setdefault(node, {})
+    index = indexes.get(index_class)
+    if index is None or not index.is_current(node):
+        index = indexes[index_class] = index_class(node)
+    return index
+
+
+def get_child_index(node):
+    """Return the cached _ChildIndex of node"""
+    return get_node_index(node, _ChildIndex)
+
+
+def invalidate_node_indexes(node):
+    """Drop the cached indexes of node after modifying its children"""
+    _node_indexes.pop(node, None)
+
+
+# incremented whenever TheZ, TheC or TheT of a plane is set, as elements don't know their parent
+_plane_key_generation = 0
+
+
+def _plane_keys_changed():
+    """Mark the (TheZ, TheC, TheT) lookups of all Pixels elements as stale"""
+    global _plane_key_generation
+    _plane_key_generation += 1
+
+
+def iter_original_metadata(node, ns):
+    """Iterate over the original metadata of a StructuredAnnotations node
+
+    See OMEXML.StructuredAnnotations.iter_original_metadata
+    """
+    #
+    # Here's the XML we're traversing:
+    #
+    # <StructuredAnnotations>
+    #    <XMLAnnotation>
+    #        <Value>
+    #            <OriginalMetadta>
+    #                <Key>Foo</Key>
+    #                <Value>Bar</Value>
+    #            </OriginalMetadata>
+    #        </Value>
+    #    </XMLAnnotation>
+    # </StructuredAnnotations>
+    #
+    for annotation_node in node.findall(qn(ns['sa'], "XMLAnnotation")):
+        # <XMLAnnotation/>
+        annotation_id = annotation_node.get("ID")
+        for xa_value_node in annotation_node.findall(qn(ns['sa'], "Value")):
+            # <Value/>
+            for om_node in xa_value_node.findall(qn(NS_ORIGINAL_METADATA, "OriginalMetadata")):
+                # <OriginalMetadata>
+                key_node = om_node.find(qn(NS_ORIGINAL_METADATA, "Key"))
+                value_node = om_node.find(qn(NS_ORIGINAL_METADATA, "Value"))
+                if key_node is not None and value_node is not None:
+                    key_text = get_text(key_node)
+                    value_text = get_text(value_node)
+                    if key_text is not None and value_text is not None:
+                        yield annotation_id, (key_text, value_text)
+                    else:
+                        logger.warn("Original metadata was missing key or value:" + om_node.toxml())
+
+
 def make_text_node(parent, namespace, tag_name, text):
     """Either make a new node and add the given text or replace the text
 
@@ -617,6 +748,7 @@ class OMEXML(object):
 
         def set_TheZ(self, value):
             self.node.set("TheZ", str(value))
+            _plane_keys_changed()
 
         TheZ = property(get_TheZ, set_TheZ)
 
@@ -626,6 +758,7 @@ class OMEXML(object):
 
         def set_TheC(self, value):
             self.node.set("TheC", str(value))
+            _plane_keys_changed()
 
         TheC = property(get_TheC, set_TheC)
 
@@ -635,6 +768,7 @@ class OMEXML(object):
 
         def set_TheT(self, value):
             self.node.set("TheT", str(value))
+            _plane_keys_changed()
 
         TheT = property(get_TheT, set_TheT)
 
@@ -816,7 +950,11 @@ class OMEXML(object):
             pixels.Channel(0).Name = "Red"
             ...
             """
-            return len(self.node.findall(qn(self.ns['ome'], "Channel")))
+            return len(self._children("Channel"))
+
+        def _children(self, tag):
+            """The child elements with the given tag, looked up in the cached child index"""
+            return get_child_index(self.node).children.get(qn(self.ns['ome'], tag), [])
 
         def get_channel_names(self):
             return [self.Channel(i).Name for i in range(self.get_channel_count())]
@@ -825,7 +963,7 @@ class OMEXML(object):
             assert value >= 0
             channel_count = self.channel_count
             if channel_count > value:
-                channels = self.node.findall(qn(self.ns['ome'], "Channel"))
+                channels = self._children("Channel")
                 for channel in channels[value:]:
                     self.node.remove(channel)
             else:
@@ -835,13 +973,13 @@ class OMEXML(object):
                     new_channel.ID = str(uuid.uuid4())
                     new_channel.Name = new_channel.ID
                     new_channel.SamplesPerPixel = 1
+            invalidate_node_indexes(self.node)
 
         channel_count = property(get_channel_count, set_channel_count)
 
         def Channel(self, index=0):
             """Get the indexed channel from the Pixels element"""
-            channel = self.node.findall(qn(self.ns['ome'], "Channel"))[index]
-            return OMEXML.Channel(channel)
+            return OMEXML.Channel(self._children("Channel")[index])
 
         def get_plane_count(self):
             """The number of planes in the image
@@ -856,31 +994,99 @@ class OMEXML(object):
             pixels.Plane(0).TheZ=pixels.Plane(0).TheC=pixels.Plane(0).TheT=0
             ...
             """
-            return len(self.node.findall(qn(self.ns['ome'], "Plane")))
+            return len(self._children("Plane"))
 
         def set_plane_count(self, value):
             assert value >= 0
             plane_count = self.plane_count
             if plane_count > value:
-                planes = self.node.findall(qn(self.ns['ome'], "Plane"))
+                planes = self._children("Plane")
                 for plane in planes[value:]:
                     self.node.remove(plane)
             else:
                 for _ in range(plane_count, value):
                     # Create the necessary planes
                     OMEXML.Plane(ElementTree.SubElement(self.node, qn(self.ns['ome'], "Plane")))
+            invalidate_node_indexes(self.node)
 
         plane_count = property(get_plane_count, set_plane_count)
 
         def Plane(self, index=0):
             """Get the indexed plane from the Pixels element"""
-            plane = self.node.findall(qn(self.ns['ome'], "Plane"))[index]
+            return OMEXML.Plane(self._children("Plane")[index])
+
+        def get_plane(self, the_z=0, the_c=0, the_t=0):
+            """Get the plane with the given TheZ, TheC and TheT indices
+
+            Raises KeyError if there is no such plane. Indices set through Plane or set_planes_table
+            are taken into account, after setting them directly on the elements call
+            invalidate_node_indexes.
+            """
+            key = (the_z, the_c, the_t)
+            index = get_child_index(self.node)
+            if index.planes is None or index.planes_generation != _plane_key_generation:
+                self._index_planes(index)
+            plane = index.planes.get(key)
+            if plane is not None and self._plane_key(plane) != key:
+                self._index_planes(index)
+                plane = index.planes.get(key)
+            if plane is None:
+                raise KeyError("No plane with TheZ=%d, TheC=%d, TheT=%d" % key)
             return OMEXML.Plane(plane)
 
+        def planes_table(self):
+            """The attributes of all Plane elements as a structured array of PLANES_TABLE_DTYPE
+
+            Rows are in document order. TheZ, TheC and TheT default to 0, the other attributes to
+            NaN if absent.
+            """
+            planes = self._children("Plane")
+            columns = []
+            for name in PLANES_TABLE_DTYPE.names:
+                if PLANES_TABLE_DTYPE[name].kind == "i":
+                    columns.append([int(plane.get(name, 0)) for plane in planes])
+                else:
+                    columns.append([float(plane.get(name, "nan")) for plane in planes])
+            table = np.empty(len(planes), PLANES_TABLE_DTYPE)
+            for name, column in zip(PLANES_TABLE_DTYPE.names, columns):
+                table[name] = column
+            return table
+
+        def set_planes_table(self, table):
+            """Set the Plane elements from a structured array like planes_table returns
+
+            The plane count is set to the length of table and the attributes named by its fields are
+            written to the planes in document order. NaN removes a float attribute. Fields not in
+            PLANES_TABLE_DTYPE are ignored.
+            """
+            self.set_plane_count(len(table))
+            planes = self._children("Plane")
+            _plane_keys_changed()
+            for name in table.dtype.names:
+                if name not in PLANES_TABLE_DTYPE.names:
+                    continue
+                values = table[name].tolist()
+                if PLANES_TABLE_DTYPE[name].kind == "i":
+                    for plane, value in zip(planes, values):
+                        plane.set(name, str(value))
+                    continue
+                for plane, value in zip(planes, values):
+                    if value != value:
+                        plane.attrib.pop(name, None)
+                    else:
+                        plane.set(name, str(value))
+
+        def _index_planes(self, index):
+            index.planes = {self._plane_key(plane): plane for plane in self._children("Plane")}
+            index.planes_generation = _plane_key_generation
+
+        @staticmethod
+        def _plane_key(plane):
+            return tuple(int(plane.get(name, 0)) for name in ("TheZ", "TheC", "TheT"))
+
         def TiffData(self, index=0):
             """Get the indexed TiffData from the Pixels element"""
-            tiffData = self.node.findall(qn(self.ns['ome'], "TiffData"))[index]
-            return OMEXML.TiffData(tiffData)
+            return OMEXML.TiffData(self._children("TiffData")[index])
 
         def get_planes_of_channel(self, index):
             planes = self.node.findall(qn(self.ns['ome'], "Plane[@TheC='"+str(index)+"']"))
@@ -888,11 +1094,12 @@ class OMEXML(object):
 
         # does not fix up any indices
         def remove_channel(self, index):
-            channel = self.node.findall(qn(self.ns['ome'], "Channel"))[index]
+            channel = self._children("Channel")[index]
             self.node.remove(channel)
             planes = self.get_planes_of_channel(index)
             for p in planes:
                 self.node.remove(p)
+            invalidate_node_indexes(self.node)
 
         def append_channel(self, index, name):
             # add channel
@@ -909,21 +1116,38 @@ class OMEXML(object):
                     new_plane.TheC = str(index)
                     new_plane.TheZ = str(z)
                     new_plane.TheT = str(t)
+            invalidate_node_indexes(self.node)
             # update SizeC
             self.set_SizeC(self.get_SizeC() + 1)
 
         # can be done as a single step just prior to final output
-        def populate_TiffData(self):
-            """ assuming Pixels has its sizes, set up tiffdata elements"""
+        def populate_TiffData(self, compact=False):
+            """ assuming Pixels has its sizes, set up tiffdata elements
+
+            By default, there is one TiffData element per plane. With compact=True, a single
+            TiffData element with IFD=0 and PlaneCount set to the number of planes states that
+            all planes are stored in DimensionOrder, which keeps the OME-XML small for many planes.
+            """
             assert self.SizeC is not None
             assert self.SizeZ is not None
             assert self.SizeT is not None
             total = self.SizeC * self.SizeT * self.SizeZ
             # blow away the old ones.
-            tiffdatas = self.node.findall(qn(self.ns['ome'], "TiffData"))
+            tiffdatas = self._children("TiffData")
             for td in tiffdatas:
                 self.node.remove(td)
 
+            if compact:
+                new_tiffdata = OMEXML.TiffData(
+                    ElementTree.SubElement(self.node, qn(self.ns['ome'], "TiffData")))
+                new_tiffdata.set_FirstT(0)
+                new_tiffdata.set_FirstZ(0)
+                new_tiffdata.set_FirstC(0)
+                new_tiffdata.set_IFD(0)
+                new_tiffdata.set_PlaneCount(total)
+                invalidate_node_indexes(self.node)
+                return
+
             sizes = {
                 "Z": self.SizeZ,
                 "C": self.SizeC,
@@ -953,6 +1177,7 @@ class OMEXML(object):
                         # uuidelem = ElementTree.SubElement(new_tiffdata.node, qn(self.ns['ome'], "UUID"))
                         # uuidelem.text = self.ome_uuid
                         ifd = ifd + 1
+            invalidate_node_indexes(self.node)
 
     class StructuredAnnotations(dict):
         """The OME/StructuredAnnotations element
@@ -978,11 +1203,14 @@ class OMEXML(object):
             self.node = node
             self.ns = get_namespaces(self.node)
 
+        def _index(self):
+            return get_node_index(self.node, _AnnotationIndex)
+
         def __getitem__(self, key):
-            for child in self.node:
-                if child.get("ID") == key:
-                    return child
-            raise IndexError('ID "%s" not found' % key)
+            child = self._index().ids.get(key)
+            if child is None:
+                raise IndexError('ID "%s" not found' % key)
+            return child
 
         def __contains__(self, key):
             return self.has_key(key)
@@ -992,10 +1220,7 @@ class OMEXML(object):
                           [child.get("ID") for child in self.node])
 
         def has_key(self, key):
-            for child in self.node:
-                if child.get("ID") == key:
-                    return True
-            return False
+            return key is not None and key in self._index().ids
 
         def add_original_metadata(self, key, value):
             """Create an original data key/value pair
@@ -1018,6 +1243,7 @@ class OMEXML(object):
             ov_value = ElementTree.SubElement(
                 ov, qn(NS_ORIGINAL_METADATA, "Value"))
             set_text(ov_value, value)
+            invalidate_node_indexes(self.node)
             return node_id
 
         def iter_original_metadata(self):
@@ -1032,43 +1258,11 @@ class OMEXML(object):
                   OM_* names of a TIFF tag
                   <value> is the value for the metadata
             """
-            #
-            # Here's the XML we're traversing:
-            #
-            # <StructuredAnnotations>
-            #    <XMLAnnotation>
-            #        <Value>
-            #            <OriginalMetadta>
-            #                <Key>Foo</Key>
-            #                <Value>Bar</Value>
-            #            </OriginalMetadata>
-            #        </Value>
-            #    </XMLAnnotation>
-            # </StructuredAnnotations>
-            #
-            for annotation_node in self.node.findall(qn(self.ns['sa'], "XMLAnnotation")):
-                # <XMLAnnotation/>
-                annotation_id = annotation_node.get("ID")
-                for xa_value_node in annotation_node.findall(qn(self.ns['sa'], "Value")):
-                    # <Value/>
-                    for om_node in xa_value_node.findall(qn(NS_ORIGINAL_METADATA, "OriginalMetadata")):
-                        # <OriginalMetadata>
-                        key_node = om_node.find(qn(NS_ORIGINAL_METADATA, "Key"))
-                        value_node = om_node.find(qn(NS_ORIGINAL_METADATA, "Value"))
-                        if key_node is not None and value_node is not None:
-                            key_text = get_text(key_node)
-                            value_text = get_text(value_node)
-                            if key_text is not None and value_text is not None:
-                                yield annotation_id, (key_text, value_text)
-                            else:
-                                logger.warn("Original metadata was missing key or value:" + om_node.toxml())
-            return
+            return iter_original_metadata(self.node, self.ns)
 
         def has_original_metadata(self, key):
             '''True if there is an original metadata item with the given key'''
-            return any([k == key
-                        for annotation_id, (k, v)
-                        in self.iter_original_metadata()])
+            return key in self._index().values
 
         def get_original_metadata_value(self, key, default=None):
             """Return the value for a particular original metadata key
@@ -1076,10 +1270,7 @@ class OMEXML(object):
             key - key to search for
             default - default value to return if not found
             """
-            for annotation_id, (k, v) in self.iter_original_metadata():
-                if k == key:
-                    return v
-            return default
+            return self._index().values.get(key, default)
 
         def get_original_metadata_refs(self, ids):
             """For a given ID, get the matching original metadata references
@@ -1088,11 +1279,10 @@ class OMEXML(object):
 
             returns a dictionary of key to value
             """
-            d = {}
-            for annotation_id, (k, v) in self.iter_original_metadata():
-                if annotation_id in ids:
-                    d[k] = v
-            return d
+            original_metadata = self._index().original_metadata
+            items = [item for annotation_id in set(ids) for item in original_metadata.get(annotation_id, [])]
+            # later items win, as when walking the annotations in document order
+            return {k: v for position, k, v in sorted(items)}
 
         @property
         def OriginalMetadata(self):
@@ -1122,7 +1312,7 @@ class OMEXML(object):
                 yield key
 
         def __len__(self):
-            return len(list(self.sa_iter_original_metadata()))
+            return sum(len(items) for items in self.sa._index().original_metadata.values())
 
         def keys(self):
             return [key
@@ -1130,10 +1320,7 @@ class OMEXML(object):
                     in self.sa.iter_original_metadata()]
 
         def has_key(self, key):
-            for annotation_id, (k, value) in self.sa.iter_original_metadata():
-                if k == key:
-                    return True
-            return False
+            return self.sa.has_original_metadata(key)
 
         def iteritems(self):
             for annotation_id, (key, value) in self.sa.iter_original_metadata():
@@ -1,34 +1,257 @@
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
 import numpy as np
 import itertools as it
 
-def apply_2d_trafo(trafo_2d, array_5d, **kwargs):
+from apeer_ometiff_library.io import OmeTiffFile, OmeTiffWriter
+
+
+def apply_2d_trafo(trafo_2d, array_5d, executor=None, max_workers=None, batch_size=None, **kwargs):
+    """
+    Apply a 2D transform to every YX plane of a 5D TZCYX array
+
+    Parameters
+    ----------
+    trafo_2d : Callable
+        Called as trafo_2d(plane, **kwargs) for every plane, returning the transformed plane.
+    array_5d : np.ndarray
+        5D array in TZCYX order.
+    executor : Optional[Executor or str]
+        Runs the transforms concurrently, either an Executor that is used as is, or "thread" or
+        "process" for a pool of max_workers threads or processes created for this call. Threads
+        suit transforms releasing the GIL, like most scipy and scikit-image filters. With
+        processes, trafo_2d must be picklable and planes are copied to and from the workers.
+        "shared_memory" also uses a process pool, for pure Python transforms holding the GIL,
+        but copies the input and output arrays to shared memory once and only sends plane
+        indices to the workers. By default, the planes are transformed serially, unless
+        max_workers is given.
+    max_workers : Optional[int]
+        Number of workers of the pool created for executor, by default one per CPU core. If only
+        max_workers is given, a thread pool is used.
+    batch_size : Optional[int]
+        Pass blocks of up to batch_size planes, as (N, Y, X) arrays in TZC order, to trafo_2d
+        instead of single planes. trafo_2d has to transform every plane of the block and return
+        an array of the same shape, e.g. a vectorised numpy expression, which saves the overhead
+        of one call per plane on stacks of many small planes.
+    """
     n_t, n_z, n_c, n_x, n_y = np.shape(array_5d)
-    array_out_5d = None
-    firstIteration = True
+    if batch_size is None:
+        indices = it.product(range(n_t), range(n_z), range(n_c))
+    else:
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+        # batches index the (t, z, c) of their planes rather than a reshaped array, which would copy
+        # the whole of a non-contiguous input, e.g. a transposed memmap
+        plane_count = n_t * n_z * n_c
+        indices = (
+            np.unravel_index(np.arange(start, min(start + batch_size, plane_count)), (n_t, n_z, n_c))
+            for start in range(0, plane_count, batch_size)
+        )
 
-    for t, z, c in it.product(range(n_t), range(n_z), range(n_c)):
-        result = trafo_2d(array_5d[t, z, c, :, :], **kwargs)
-        if firstIteration:
-            array_out_5d = np.zeros_like(array_5d, result.dtype)
-            firstIteration = False
-        array_out_5d[t, z, c, :, :] = result
+    jobs = ((index, index, Ellipsis) for index in indices)
+    return _apply(trafo_2d, array_5d, jobs, executor, max_workers, kwargs)
 
-    return array_out_5d
+
+def apply_2d_trafo_blocks(trafo_2d, array_5d, block_shape, halo=0, executor=None, max_workers=None,
+                          **kwargs):
+    """
+    Apply a 2D transform to every YX plane of a 5D TZCYX array block by block
+
+    Every plane is split into blocks of block_shape, which are passed to trafo_2d together with a
+    margin of halo pixels of the neighbouring data on each side, clipped at the plane border. The
+    margin is cropped from the results before they are stitched together, so that filters with a
+    footprint of up to 2 * halo + 1 pixels give the same result as on the whole plane, while the
+    transform only ever works on a block and its halo.
+
+    Parameters
+    ----------
+    trafo_2d : Callable
+        Called as trafo_2d(window, **kwargs) for every block, returning an array of the same shape.
+    array_5d : np.ndarray
+        5D array in TZCYX order.
+    block_shape : Tuple[int, int]
+        (length, width) of the blocks, blocks at the end of a plane can be smaller.
+    halo : int or Tuple[int, int]
+        Margin in pixels around every block along Y and X.
+    executor, max_workers
+        Run the transforms of the blocks concurrently, see apply_2d_trafo.
+    """
+    n_t, n_z, n_c, n_y, n_x = np.shape(array_5d)
+    block_y, block_x = block_shape
+    halo_y, halo_x = (halo, halo) if np.ndim(halo) == 0 else halo
+    if block_y < 1 or block_x < 1 or halo_y < 0 or halo_x < 0:
+        raise ValueError(f"Invalid block shape {block_shape} or halo {halo}")
+
+    def windows():
+        for t, z, c in it.product(range(n_t), range(n_z), range(n_c)):
+            for y, x in it.product(range(0, n_y, block_y), range(0, n_x, block_x)):
+                block = (slice(y, min(y + block_y, n_y)), slice(x, min(x + block_x, n_x)))
+                window = (slice(max(y - halo_y, 0), block[0].stop + halo_y),
+                          slice(max(x - halo_x, 0), block[1].stop + halo_x))
+                # position of the block within the window
+                crop = (slice(y - window[0].start, block[0].stop - window[0].start),
+                        slice(x - window[1].start, block[1].stop - window[1].start))
+                yield (t, z, c) + window, (t, z, c) + block, crop
+
+    return _apply(trafo_2d, array_5d, windows(), executor, max_workers, kwargs)
+
+
+def _apply(trafo, array, jobs, executor, max_workers, kwargs, dtype=None):
+    """
+    Return an array of the shape of array holding trafo(array[input_index], **kwargs)[crop] at
+    output_index for every (input_index, output_index, crop) in jobs, or None without jobs
+
+    The first job is run up front to allocate the output with the dtype of its result, unless
+    dtype is given.
+    """
+    jobs = iter(jobs)
+    first = next(jobs, None)
+    if first is None:
+        return None
+    input_index, output_index, crop = first
+    result = trafo(array[input_index], **kwargs)
+    array_out = np.zeros(np.shape(array), dtype or result.dtype)
+    array_out[output_index] = result[crop]
+
+    if executor == "shared_memory":
+        _apply_shared_memory(trafo, array, array_out, jobs, max_workers, kwargs)
+    else:
+        tasks = ((job, trafo, (array[job[0]],), kwargs) for job in jobs)
+        for (input_index, output_index, crop), result in _run_tasks(tasks, executor, max_workers):
+            array_out[output_index] = result[crop]
+    return array_out
+
+
+# arrays and transform of a shared memory worker process, set up by _init_shared_memory_worker
+_worker_state = {}
+
+
+def _attach_shared_array(name, shape, dtype):
+    # workers share the resource tracker of the parent process, which unlinks the shared memory
+    shared_memory = SharedMemory(name)
+    return shared_memory, np.ndarray(shape, dtype, buffer=shared_memory.buf)
+
+
+def _init_shared_memory_worker(trafo, kwargs, input_spec, output_spec):
+    _worker_state["trafo"] = trafo
+    _worker_state["kwargs"] = kwargs
+    _worker_state["input"] = _attach_shared_array(*input_spec)
+    _worker_state["output"] = _attach_shared_array(*output_spec)
+
+
+def _run_shared_memory_job(input_index, output_index, crop):
+    array = _worker_state["input"][1]
+    array_out = _worker_state["output"][1]
+    result = _worker_state["trafo"](array[input_index], **_worker_state["kwargs"])
+    array_out[output_index] = result[crop]
 
 
-def apply_3d_trafo_zstack(trafo_3d, array_5d, **kwargs):
+def _apply_shared_memory(trafo, array, array_out, jobs, max_workers, kwargs):
+    """Run the jobs of _apply on a process pool whose workers share array and array_out"""
+    shared_memories = []
+    shared_arrays = []
+    try:
+        for source in (array, array_out):
+            shared_memory = SharedMemory(create=True, size=max(source.nbytes, 1))
+            shared_memories.append(shared_memory)
+            shared_arrays.append(np.ndarray(source.shape, source.dtype, buffer=shared_memory.buf))
+        shared_arrays[0][...] = array
+
+        specs = [(shared_memory.name, source.shape, source.dtype)
+                 for shared_memory, source in zip(shared_memories, (array, array_out))]
+        with ProcessPoolExecutor(
+            max_workers, initializer=_init_shared_memory_worker, initargs=(trafo, kwargs, *specs)
+        ) as pool:
+            max_pending = 2 * (max_workers or os.cpu_count() or 1)
+            tasks = ((job, _run_shared_memory_job, job, {}) for job in jobs)
+            for (input_index, output_index, crop), result in _run_tasks_on(pool, tasks, max_pending):
+                array_out[output_index] = shared_arrays[1][output_index]
+    finally:
+        # the buffers can only be released once no array refers to them
+        shared_arrays.clear()
+        for shared_memory in shared_memories:
+            shared_memory.close()
+            shared_memory.unlink()
+
+
+def _run_tasks(tasks, executor=None, max_workers=None):
+    """
+    Yield (key, function(*args, **kwargs)) for every (key, function, args, kwargs) in tasks
+
+    Results are yielded in the order of tasks. On an executor, at most twice as many tasks as
+    workers are pending at once, so that the inputs and results held in memory stay bounded.
+    """
+    if executor is None and max_workers is not None and max_workers > 1:
+        executor = "thread"
+    if executor is None:
+        for key, function, args, kwargs in tasks:
+            yield key, function(*args, **kwargs)
+        return
+
+    # ThreadPoolExecutor would default to more workers than cores
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = 2 * max_workers
+    if isinstance(executor, Executor):
+        yield from _run_tasks_on(executor, tasks, max_pending)
+    elif executor in ("thread", "process"):
+        pool_class = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+        with pool_class(max_workers) as pool:
+            yield from _run_tasks_on(pool, tasks, max_pending)
+    else:
+        raise ValueError(f"Unknown executor {executor!r}, expected an Executor, 'thread' or 'process'")
+
+
+def _run_tasks_on(executor, tasks, max_pending):
+    pending = deque()
+    for key, function, args, kwargs in tasks:
+        if len(pending) >= max_pending:
+            done_key, future = pending.popleft()
+            yield done_key, future.result()
+        pending.append((key, executor.submit(function, *args, **kwargs)))
+    while pending:
+        done_key, future = pending.popleft()
+        yield done_key, future.result()
+
+
+def apply_3d_trafo_zstack(trafo_3d, array_5d, slab_size=None, halo=0, executor=None, max_workers=None,
+                          **kwargs):
+    """
+    Apply a 3D transform to every ZYX stack of a 5D TZCYX array
+
+    Parameters
+    ----------
+    trafo_3d : Callable
+        Called as trafo_3d(zstack, **kwargs) for every (t, c), returning an array of the same shape.
+    array_5d : np.ndarray
+        5D array in TZCYX order.
+    slab_size : Optional[int]
+        Split every Z-stack into slabs of up to slab_size planes, which are passed to trafo_3d
+        together with halo planes of the neighbouring data on each side, clipped at the ends of
+        the stack. The halo is cropped from the results before they are stitched together, so that
+        filters reaching up to halo planes along Z give the same result as on the whole stack. By
+        default, whole Z-stacks are transformed.
+    halo : int
+        Number of planes added to both sides of every slab.
+    executor, max_workers
+        Run the transforms of the stacks and slabs concurrently, see apply_2d_trafo.
+    """
     n_t, n_z, n_c, n_x, n_y = np.shape(array_5d)
-    array_out_5d = None
-    firstIteration = True
+    slab_size = slab_size or n_z
+    if slab_size < 1 or halo < 0:
+        raise ValueError(f"Invalid slab size {slab_size} or halo {halo}")
 
-    for t, c in it.product(range(n_t), range(n_c)):
-        result = trafo_3d(array_5d[t, :, c, :, :], **kwargs)
-        if firstIteration:
-            array_out_5d = np.zeros_like(array_5d, dtype=array_5d.dtype)
-        firstIteration = False
-        array_out_5d[t, :, c, :, :] = result
+    def slabs():
+        for t, c in it.product(range(n_t), range(n_c)):
+            for z in range(0, n_z, slab_size):
+                slab = slice(z, min(z + slab_size, n_z))
+                window = slice(max(z - halo, 0), min(slab.stop + halo, n_z))
+                crop = slice(slab.start - window.start, slab.stop - window.start)
+                yield (t, window, c), (t, slab, c), crop
 
-    return array_out_5d
+    return _apply(trafo_3d, array_5d, slabs(), executor, max_workers, kwargs, dtype=array_5d.dtype)
 
 
 def apply_3d_trafo_rgb(trafo_3d, array_5d, **kwargs):
@@ -44,3 +267,80 @@ def apply_3d_trafo_rgb(trafo_3d, array_5d, **kwargs):
         array_out_5d[t, z, :, :, :] = result
 
     return array_out_5d
+
+
+def _check_file_executor(executor):
+    if isinstance(executor, str) and executor == "shared_memory":
+        raise ValueError("executor 'shared_memory' is not supported when streaming planes from a file, "
+                         "use 'process' instead")
+
+
+def apply_2d_trafo_to_file(trafo_2d, input_path, output_path, compression=None, tile=None,
+                           executor=None, max_workers=None, **kwargs):
+    """
+    Apply a 2D transform to every YX plane of the first image of an OME-TIFF file, streaming the
+    results into a new OME-TIFF file
+
+    Planes are read one at a time and every result is written as soon as it is available, so only
+    a few planes are held in memory regardless of the size of the image.
+
+    Parameters
+    ----------
+    trafo_2d : Callable
+        Called as trafo_2d(plane, **kwargs) for every plane, see apply_2d_trafo.
+    input_path, output_path : str or Path
+        Files to read from and to write to.
+    compression, tile
+        Storage of the output file, see write_ometiff.
+    executor, max_workers
+        Run the transforms concurrently, see apply_2d_trafo. "shared_memory" is not supported, as
+        the planes are streamed rather than held in one array, use "process" instead.
+
+    The OME-XML of the output is that of the input, e.g. with its channel names and physical
+    sizes, updated to the shape and dtype of the results.
+    """
+    _check_file_executor(executor)
+    with OmeTiffFile(input_path) as ome_tiff_file:
+        n_t, n_z, n_c = ome_tiff_file.images[0].shape[:3]
+        indices = it.product(range(n_t), range(n_z), range(n_c))
+        tasks = ((index, trafo_2d, (ome_tiff_file.read_plane(*index),), kwargs) for index in indices)
+        writer = None
+        try:
+            for (t, z, c), result in _run_tasks(tasks, executor, max_workers):
+                if writer is None:
+                    writer = OmeTiffWriter(output_path, (n_t, n_z, n_c) + result.shape, result.dtype,
+                                           compression=compression, tile=tile,
+                                           omexml_string=ome_tiff_file.omexml_string)
+                writer.write_plane(result, t=t, z=z, c=c)
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+def apply_3d_trafo_zstack_to_file(trafo_3d, input_path, output_path, compression=None, tile=None,
+                                  executor=None, max_workers=None, **kwargs):
+    """
+    Apply a 3D transform to every ZYX stack of the first image of an OME-TIFF file, streaming the
+    results into a new OME-TIFF file
+
+    Only the planes of one Z-stack per pending transform are held in memory. See
+    apply_2d_trafo_to_file for the parameters, trafo_3d is called as trafo_3d(zstack, **kwargs).
+    """
+    _check_file_executor(executor)
+    with OmeTiffFile(input_path) as ome_tiff_file:
+        n_t, n_z, n_c = ome_tiff_file.images[0].shape[:3]
+        tasks = (
+            ((t, c), trafo_3d, (ome_tiff_file.read(t=t, c=c, axes="ZYX")[0],), kwargs)
+            for t, c in it.product(range(n_t), range(n_c))
+        )
+        writer = None
+        try:
+            for (t, c), result in _run_tasks(tasks, executor, max_workers):
+                if writer is None:
+                    writer = OmeTiffWriter(output_path, (n_t, result.shape[0], n_c) + result.shape[1:],
+                                           result.dtype, compression=compression, tile=tile,
+                                           omexml_string=ome_tiff_file.omexml_string)
+                writer.write_zstack(result, t=t, c=c)
+        finally:
+            if writer is not None:
+                writer.close()
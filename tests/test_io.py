@@ -1,12 +1,15 @@
 import math
 import os
 import unittest
+from unittest import mock
+from xml.etree import ElementTree
 from pathlib import Path
 
 import numpy as np
 import tifffile
 
-from apeer_ometiff_library.io import OmeTiffFile, write_ometiff
+from apeer_ometiff_library import omexmlClass
+from apeer_ometiff_library.io import OmeTiffDataset, OmeTiffFile, OmeTiffWriter, gen_xml, write_ometiff
 
 # Change to True if you want to include log running tests in the test suite
 _RUN_SLOW_TESTS = False
@@ -57,17 +60,13 @@ class TestOmeTiffFile(unittest.TestCase):
         # apeeer-ome-tiff library does not support writing multi-page files
         # hence test data needs to be created with tifffile directly
         with tifffile.TiffWriter(self.multi_series_ometiff_path) as tiff_writer:
-            tiff_writer.save(
+            tiff_writer.write(
                 self.multi_series_ometiff_array0,
                 photometric="minisblack",
                 description=self.multi_series_metadata,
                 metadata={},
             )
-
-        with tifffile.TiffWriter(
-            self.multi_series_ometiff_path, append=True
-        ) as tiff_writer:
-            tiff_writer.save(
+            tiff_writer.write(
                 self.multi_series_ometiff_array1,
                 photometric="minisblack",
                 subfiletype=1,
@@ -85,11 +84,190 @@ class TestOmeTiffFile(unittest.TestCase):
         with OmeTiffFile(self.multi_series_ometiff_path) as ome_tiff_file:
             self.assertTrue(ome_tiff_file.is_multi_series)
 
+    def test_images(self):
+        with OmeTiffFile(self.multi_series_ometiff_path) as ome_tiff_file:
+            images = ome_tiff_file.images
+            self.assertEqual([image.shape for image in images], [(1, 1, 1, 32, 64), (1, 1, 1, 64, 32)])
+            self.assertEqual(images[0].dimension_order, "XYCZT")
+            self.assertEqual(images[0].pixel_type, "uint8")
+            with self.assertRaises(AttributeError):
+                images[0].size_x = 1
+            with self.assertRaises(ValueError):
+                images[0].ifd_map[0, 0, 0] = 1
+
     def test_read(self):
         with OmeTiffFile(self.ometiff_path) as ome_tiff_file:
             array, omexml_string = ome_tiff_file.read()
             np.testing.assert_equal(array, self.ometiff_array)
 
+    def test_read_plane(self):
+        array = np.arange(2 * 3 * 4 * 32 * 64, dtype=np.uint16).reshape((2, 3, 4, 32, 64))
+        write_ometiff(str(self.ometiff_path), array)
+
+        with OmeTiffFile(self.ometiff_path) as ome_tiff_file:
+            np.testing.assert_equal(ome_tiff_file.read_plane(1, 2, 3), array[1, 2, 3])
+            np.testing.assert_equal(ome_tiff_file.read_plane(t=0, z=1, c=2), array[0, 1, 2])
+
+    def test_read_selection(self):
+        array = np.arange(2 * 3 * 4 * 32 * 64, dtype=np.uint16).reshape((2, 3, 4, 32, 64))
+        write_ometiff(str(self.ometiff_path), array)
+
+        with OmeTiffFile(self.ometiff_path) as ome_tiff_file:
+            selection, omexml_string = ome_tiff_file.read(t=1)
+            np.testing.assert_equal(selection, array[1:2])
+            selection, omexml_string = ome_tiff_file.read(z=slice(1, None), c=[3, 0])
+            np.testing.assert_equal(selection, array[:, 1:, [3, 0]])
+
+    def test_read_region(self):
+        array = np.arange(1 * 1 * 2 * 256 * 256, dtype=np.uint16).reshape((1, 1, 2, 256, 256))
+
+        for compression in (None, "adobe_deflate"):
+            write_ometiff(str(self.ometiff_path), array, compression=compression)
+            with OmeTiffFile(self.ometiff_path) as ome_tiff_file:
+                region = ome_tiff_file.read_region(c=1, y=slice(100, 200), x=slice(10, 50))
+                np.testing.assert_equal(region, array[0, 0, 1, 100:200, 10:50])
+                region = ome_tiff_file.read_region(c=1, y=slice(None, None, -3), x=slice(240, None))
+                np.testing.assert_equal(region, array[0, 0, 1, ::-3, 240:])
+
+    def test_as_array(self):
+        array = np.arange(2 * 3 * 4 * 64 * 48, dtype=np.uint16).reshape((2, 3, 4, 64, 48))
+        write_ometiff(str(self.ometiff_path), array, compression="adobe_deflate", tile=(16, 16))
+
+        with OmeTiffFile(self.ometiff_path) as ome_tiff_file:
+            lazy_array = ome_tiff_file.as_array()
+            self.assertEqual(lazy_array.shape, array.shape)
+            self.assertEqual(lazy_array.dtype, array.dtype)
+            np.testing.assert_equal(lazy_array[1], array[1])
+            np.testing.assert_equal(lazy_array[..., 20:40:3, -1], array[..., 20:40:3, -1])
+            np.testing.assert_equal(lazy_array[:, 2, [3, 0], 5], array[:, 2, [3, 0], 5])
+            np.testing.assert_equal(np.asarray(lazy_array), array)
+            np.testing.assert_equal(lazy_array.__array__(np.float32, copy=True), array.astype(np.float32))
+            with self.assertRaises(ValueError):
+                lazy_array.__array__(copy=False)
+            with self.assertRaises(IndexError):
+                lazy_array[0, 3]
+
+    def test_plane_cache(self):
+        array = np.arange(2 * 3 * 4 * 32 * 64, dtype=np.uint16).reshape((2, 3, 4, 32, 64))
+        write_ometiff(str(self.ometiff_path), array, compression="adobe_deflate")
+        plane_nbytes = 32 * 64 * 2
+
+        with OmeTiffFile(self.ometiff_path, cache_bytes=3 * plane_nbytes) as ome_tiff_file:
+            np.testing.assert_equal(ome_tiff_file.read_plane(1, 2, 3), array[1, 2, 3])
+            np.testing.assert_equal(ome_tiff_file.read_plane(1, 2, 3), array[1, 2, 3])
+            self.assertEqual(ome_tiff_file.cache_info(), (1, 1, 3 * plane_nbytes, plane_nbytes))
+
+            selection, omexml_string = ome_tiff_file.read(t=0, z=0, c=slice(0, 3), max_workers=2)
+            np.testing.assert_equal(selection, array[:1, :1, :3])
+            # the least recently used plane (1, 2, 3) was evicted
+            region = ome_tiff_file.read_region(t=0, z=0, c=1, y=slice(5, 9), x=slice(None, None, 2))
+            np.testing.assert_equal(region, array[0, 0, 1, 5:9, ::2])
+            np.testing.assert_equal(ome_tiff_file.read_plane(1, 2, 3), array[1, 2, 3])
+            self.assertEqual(ome_tiff_file.cache_info(), (2, 5, 3 * plane_nbytes, 3 * plane_nbytes))
+
+            ome_tiff_file.cache_clear()
+            self.assertEqual(ome_tiff_file.cache_info(), (0, 0, 3 * plane_nbytes, 0))
+
+    def test_read_multithreaded(self):
+        array = np.random.randint(0, 4, (2, 3, 4, 128, 128), dtype=np.uint8)
+        write_ometiff(str(self.ometiff_path), array, compression="adobe_deflate")
+
+        with OmeTiffFile(self.ometiff_path) as ome_tiff_file:
+            selection, omexml_string = ome_tiff_file.read(max_workers=4)
+            np.testing.assert_equal(selection, array)
+            selection, omexml_string = ome_tiff_file.read(z=[2, 0], c=slice(1, 3), max_workers=4)
+            np.testing.assert_equal(selection, array[:, [2, 0], 1:3])
+
+    def test_read_memmap(self):
+        with OmeTiffFile(self.ometiff_path) as ome_tiff_file:
+            array, omexml_string = ome_tiff_file.read(mode="memmap")
+            self.assertIsInstance(array, np.memmap)
+            np.testing.assert_equal(array, self.ometiff_array)
+
+            array, omexml_string = ome_tiff_file.read(t=1, c=slice(0, 2), mode="memmap")
+            self.assertIsInstance(array, np.memmap)
+            np.testing.assert_equal(array, self.ometiff_array[1:, :, :2])
+
+    def test_read_memmap_compressed(self):
+        write_ometiff(str(self.ometiff_path), self.ometiff_array, compression="adobe_deflate")
+
+        with OmeTiffFile(self.ometiff_path) as ome_tiff_file:
+            with self.assertRaises(ValueError):
+                ome_tiff_file.read(mode="memmap")
+
+    @staticmethod
+    def _gen_xml_without_tiff_data(shape, dtype, dimension_order="XYCZT", samples_per_pixel=1):
+        metadata = omexmlClass.OMEXML(gen_xml(np.empty(shape, dtype)).decode())
+        pixels = metadata.image().Pixels
+        pixels.set_DimensionOrder(dimension_order)
+        pixels.channel_count = shape[2] // samples_per_pixel
+        for channel in range(pixels.channel_count):
+            pixels.Channel(channel).set_SamplesPerPixel(samples_per_pixel)
+        for node in pixels.node.findall(omexmlClass.qn(pixels.ns["ome"], "TiffData")):
+            pixels.node.remove(node)
+        return metadata.to_xml().encode()
+
+    def test_read_dimension_order(self):
+        array = np.arange(2 * 3 * 4 * 8 * 16, dtype=np.uint16).reshape((2, 3, 4, 8, 16))
+        # XYZCT stores the planes in TCZ order
+        omexml_string = self._gen_xml_without_tiff_data(array.shape, array.dtype, "XYZCT")
+        write_ometiff(str(self.ometiff_path), np.moveaxis(array, 1, 2).copy(), omexml_string)
+
+        with OmeTiffFile(self.ometiff_path) as ome_tiff_file:
+            np.testing.assert_equal(ome_tiff_file.read()[0], array)
+            np.testing.assert_equal(ome_tiff_file.read(z=1, c=[2, 0])[0], array[:, 1:2, [2, 0]])
+            memmap, omexml_string = ome_tiff_file.read(mode="memmap")
+            self.assertIsInstance(memmap, np.memmap)
+            np.testing.assert_equal(memmap, array)
+
+    def test_read_axes(self):
+        with OmeTiffFile(self.ometiff_path) as ome_tiff_file:
+            array, omexml_string = ome_tiff_file.read(axes="TCZYX")
+            np.testing.assert_equal(array, np.moveaxis(self.ometiff_array, 1, 2))
+            array, omexml_string = ome_tiff_file.read(t=1, c=2, axes="ZYX", mode="memmap")
+            self.assertIsInstance(array, np.memmap)
+            np.testing.assert_equal(array, self.ometiff_array[1, :, 2])
+            with self.assertRaises(ValueError):
+                ome_tiff_file.read(axes="ZYX")
+            with self.assertRaises(ValueError):
+                ome_tiff_file.read(axes="TZCYXS")
+
+    def test_read_samples_per_pixel(self):
+        rgb = np.arange(2 * 8 * 16 * 3, dtype=np.uint8).reshape((2, 8, 16, 3))
+        array = np.moveaxis(rgb, -1, 1)[np.newaxis]
+        omexml_string = self._gen_xml_without_tiff_data(array.shape, array.dtype, samples_per_pixel=3)
+        tifffile.imwrite(self.ometiff_path, rgb, photometric="rgb", description=omexml_string, metadata=None)
+
+        with OmeTiffFile(self.ometiff_path) as ome_tiff_file:
+            self.assertEqual(ome_tiff_file.images[0].samples_per_pixel, 3)
+            np.testing.assert_equal(ome_tiff_file.read()[0], array)
+            np.testing.assert_equal(ome_tiff_file.read(c=[2, 1])[0], array[:, :, [2, 1]])
+            np.testing.assert_equal(ome_tiff_file.read_plane(z=1, c=1), array[0, 1, 1])
+            np.testing.assert_equal(
+                ome_tiff_file.read_region(z=1, c=2, y=slice(2, 5)), array[0, 1, 2, 2:5]
+            )
+            self.assertEqual(ome_tiff_file.levels, [array.shape])
+            lazy_array = ome_tiff_file.as_array()
+            self.assertEqual(lazy_array.shape, array.shape)
+            np.testing.assert_equal(lazy_array[0, 1, 2], array[0, 1, 2])
+            np.testing.assert_equal(lazy_array[:, :, 1:, 3:6], array[:, :, 1:, 3:6])
+
+    def test_read_samples_per_pixel_several_ifds(self):
+        # two RGB IFDs hold the six channels
+        rgb = np.arange(2 * 8 * 16 * 3, dtype=np.uint8).reshape((2, 8, 16, 3))
+        array = np.moveaxis(rgb, -1, 1).reshape((1, 1, 6, 8, 16))
+        omexml_string = self._gen_xml_without_tiff_data(array.shape, array.dtype, samples_per_pixel=3)
+        tifffile.imwrite(self.ometiff_path, rgb, photometric="rgb", description=omexml_string, metadata=None)
+
+        with OmeTiffFile(self.ometiff_path) as ome_tiff_file:
+            np.testing.assert_equal(ome_tiff_file.read()[0], array)
+            np.testing.assert_equal(ome_tiff_file.read_plane(c=4), array[0, 0, 4])
+            # refused before the image is mapped, so it is never loaded
+            with mock.patch.object(tifffile.TiffFile, "asarray") as asarray:
+                with self.assertRaises(ValueError):
+                    ome_tiff_file.read(mode="memmap")
+                asarray.assert_not_called()
+
     def test_read_multi_series(self):
         with OmeTiffFile(self.multi_series_ometiff_path) as ome_tiff_file:
             arrays, omexml_string = ome_tiff_file.read_multi_series()
@@ -99,6 +277,52 @@ class TestOmeTiffFile(unittest.TestCase):
             )
 
 
+class TestOmeTiffDataset(unittest.TestCase):
+    def setUp(self):
+        self.array = np.arange(2 * 2 * 3 * 8 * 16, dtype=np.uint16).reshape((2, 2, 3, 8, 16))
+        self.paths = [Path(f"dataset_tmp_{t}.ome.tiff") for t in range(2)]
+
+        # every file holds one time point, the planes are referenced by file name
+        metadata = omexmlClass.OMEXML(gen_xml(self.array).decode())
+        pixels = metadata.image().Pixels
+        for node in pixels.node.findall(omexmlClass.qn(pixels.ns["ome"], "TiffData")):
+            pixels.node.remove(node)
+        for t, path in enumerate(self.paths):
+            tiff_data = ElementTree.SubElement(pixels.node, omexmlClass.qn(pixels.ns["ome"], "TiffData"))
+            tiff_data.attrib.update(FirstT=str(t), IFD="0", PlaneCount="6")
+            uuid = ElementTree.SubElement(tiff_data, omexmlClass.qn(pixels.ns["ome"], "UUID"))
+            uuid.set("FileName", path.name)
+            uuid.text = metadata.uuidStr
+        omexml_string = metadata.to_xml().encode()
+        for t, path in enumerate(self.paths):
+            write_ometiff(str(path), self.array[t:t + 1], omexml_string)
+
+    def tearDown(self) -> None:
+        for path in self.paths:
+            path.unlink()
+
+    def test_files(self):
+        with OmeTiffDataset(self.paths[0]) as dataset:
+            self.assertEqual(dataset.files, self.paths)
+            self.assertEqual(dataset.images[0].shape, self.array.shape)
+
+    def test_read(self):
+        with OmeTiffDataset(self.paths[1], max_open_files=1) as dataset:
+            array, omexml_string = dataset.read()
+            np.testing.assert_equal(array, self.array)
+            self.assertEqual(len(dataset._pool), 1)
+            np.testing.assert_equal(dataset.read(t=[1, 0], c=2)[0], self.array[[1, 0], :, 2:3])
+            np.testing.assert_equal(dataset.read(t=1, z=0, axes="CYX")[0], self.array[1, 0])
+            np.testing.assert_equal(dataset.read_plane(t=1, z=1, c=2), self.array[1, 1, 2])
+
+    def test_missing_file(self):
+        self.paths.pop().unlink()
+        with OmeTiffDataset(self.paths[0]) as dataset:
+            np.testing.assert_equal(dataset.read(t=0)[0], self.array[:1])
+            with self.assertRaises(FileNotFoundError):
+                dataset.read(t=1)
+
+
 class TestOmeTiffWrite(unittest.TestCase):
     def setUp(self) -> None:
         self._test_array = np.ones((1, 7, 2, 256, 256), dtype=np.uint8)
@@ -132,6 +356,109 @@ class TestOmeTiffWrite(unittest.TestCase):
             np.testing.assert_equal(array, self._test_array)
             os.remove(self._output_path)
 
+    def test_write_compress_multithreaded(self):
+        test_array = np.random.randint(0, 4, (1, 2, 2, 512, 512), dtype=np.uint8)
+        write_ometiff(
+            output_path=self._output_path,
+            array=test_array,
+            compression="adobe_deflate",
+            max_workers=4,
+        )
+
+        with tifffile.TiffFile(self._output_path) as tiff_file:
+            self.assertGreater(len(tiff_file.pages[0].dataoffsets), 1)
+
+        with OmeTiffFile(self._output_path) as ome_tiff_file:
+            array, omexml_string = ome_tiff_file.read()
+            np.testing.assert_equal(array, test_array)
+        os.remove(self._output_path)
+
+    def test_write_tiled(self):
+        write_ometiff(
+            output_path=self._output_path,
+            array=self._test_array,
+            compression="adobe_deflate",
+            tile=(64, 32),
+        )
+
+        with tifffile.TiffFile(self._output_path) as tiff_file:
+            self.assertTrue(tiff_file.pages[0].is_tiled)
+            self.assertEqual((tiff_file.pages[0].tilelength, tiff_file.pages[0].tilewidth), (64, 32))
+
+        with OmeTiffFile(self._output_path) as ome_tiff_file:
+            array, omexml_string = ome_tiff_file.read()
+            np.testing.assert_equal(array, self._test_array)
+            region = ome_tiff_file.read_region(z=3, c=1, y=slice(50, 80), x=slice(20, 40))
+            np.testing.assert_equal(region, self._test_array[0, 3, 1, 50:80, 20:40])
+        os.remove(self._output_path)
+
+    def test_write_pyramid(self):
+        test_array = np.random.randint(0, 255, (1, 2, 2, 100, 70), dtype=np.uint8)
+        write_ometiff(
+            output_path=self._output_path,
+            array=test_array,
+            compression="adobe_deflate",
+            pyramid_levels=2,
+        )
+
+        with tifffile.TiffFile(self._output_path) as tiff_file:
+            levels = tiff_file.series[0].levels
+            self.assertEqual(
+                [level.shape[-2:] for level in levels], [(100, 70), (50, 35), (25, 18)]
+            )
+            expected_level1 = np.rint(test_array.reshape((2, 2, 50, 2, 35, 2)).mean(axis=(3, 5)))
+            np.testing.assert_equal(levels[1].asarray(), expected_level1)
+
+        with OmeTiffFile(self._output_path) as ome_tiff_file:
+            array, omexml_string = ome_tiff_file.read()
+            np.testing.assert_equal(array, test_array)
+            self.assertEqual(
+                ome_tiff_file.levels,
+                [(1, 2, 2, 100, 70), (1, 2, 2, 50, 35), (1, 2, 2, 25, 18)],
+            )
+            array, omexml_string = ome_tiff_file.read(level=1)
+            np.testing.assert_equal(array, expected_level1[np.newaxis])
+            array, omexml_string = ome_tiff_file.read(z=1, c=0, level=1)
+            np.testing.assert_equal(array, expected_level1[np.newaxis, 1:, :1])
+            plane = ome_tiff_file.read_plane(z=1, c=1, level=2)
+            self.assertEqual(plane.shape, (25, 18))
+
+        # non-contiguous input
+        write_ometiff(output_path=self._output_path, array=test_array[:, ::-1, :, :, ::-1], pyramid_levels=1)
+        with OmeTiffFile(self._output_path) as ome_tiff_file:
+            array, omexml_string = ome_tiff_file.read(level=1)
+            expected = np.rint(test_array[:, ::-1, :, :, ::-1].reshape((1, 2, 2, 50, 2, 35, 2)).mean(axis=(4, 6)))
+            np.testing.assert_equal(array, expected)
+        os.remove(self._output_path)
+
+    def test_write_split(self):
+        test_array = np.random.randint(0, 255, (3, 2, 2, 32, 16), dtype=np.uint8)
+        for split_by, max_processes in (("T", 2), ("C", 1)):
+            paths = write_ometiff(
+                self._output_path, test_array, split_by=split_by, max_processes=max_processes
+            )
+            self.assertEqual(paths[0], f"test_{split_by}0.ome.tiff")
+            self.assertEqual(len(paths), test_array.shape["TZC".index(split_by)])
+
+            with OmeTiffDataset(paths[-1]) as dataset:
+                array, omexml_string = dataset.read()
+                np.testing.assert_equal(array, test_array)
+            with tifffile.TiffFile(paths[1]) as tiff_file:
+                self.assertEqual(len(tiff_file.pages), 12 // len(paths))
+            # a single member only holds the planes of its own index along split_by
+            with OmeTiffFile(paths[1]) as ome_tiff_file:
+                selection = {split_by.lower(): 1}
+                expected = test_array[tuple(1 if dim == split_by else 0 for dim in "TZC")]
+                np.testing.assert_equal(ome_tiff_file.read_plane(**selection), expected)
+                array, omexml_string = ome_tiff_file.read(**selection)
+                np.testing.assert_equal(array, np.take(test_array, [1], axis="TZC".index(split_by)))
+                with self.assertRaises(ValueError):
+                    ome_tiff_file.read_plane(**{split_by.lower(): 0})
+                with self.assertRaises(ValueError):
+                    ome_tiff_file.as_array()[:, :, :, 0, 0]
+            for path in paths:
+                os.remove(path)
+
     @unittest.skipUnless(
         _RUN_SLOW_TESTS,
         "Test is skipped by default because it is slow due to bigtiff data",
@@ -161,3 +488,85 @@ class TestOmeTiffWrite(unittest.TestCase):
             array, omexml_string = ome_tiff_file.read()
             np.testing.assert_equal(array, self._big_test_array)
             os.remove(self._output_path)
+
+
+class TestOmeTiffWriter(unittest.TestCase):
+    def setUp(self) -> None:
+        self._test_array = np.random.randint(0, 255, (2, 3, 2, 64, 32), dtype=np.uint8)
+        self._output_path = "test_writer.ome.tiff"
+
+    def tearDown(self) -> None:
+        os.remove(self._output_path)
+
+    def test_write_planes(self):
+        with OmeTiffWriter(self._output_path, self._test_array.shape, self._test_array.dtype) as writer:
+            for t, z, c in np.ndindex(self._test_array.shape[:3]):
+                writer.write_plane(self._test_array[t, z, c], t=t, z=z, c=c)
+
+        with OmeTiffFile(self._output_path) as ome_tiff_file:
+            array, omexml_string = ome_tiff_file.read()
+            np.testing.assert_equal(array, self._test_array)
+            # planes written in DimensionOrder are referenced by a single TiffData
+            self.assertEqual(omexml_string.count("<TiffData"), 1)
+
+    def test_write_with_base_metadata(self):
+        base = omexmlClass.OMEXML(gen_xml(np.zeros((2, 5, 3, 8, 8), np.uint16)))
+        base.image_count = 2
+        pixels = base.image().Pixels
+        pixels.set_PhysicalSizeZ(2.0)
+        pixels.Channel(0).set_Name("DAPI")
+        pixels.plane_count = 2
+        pixels.Plane(1).TheZ = 4
+
+        with OmeTiffWriter(self._output_path, self._test_array.shape, self._test_array.dtype,
+                           omexml_string=base.to_xml()) as writer:
+            for t, c in np.ndindex(2, 2):
+                writer.write_zstack(self._test_array[t, :, c], t=t, c=c)
+
+        with OmeTiffFile(self._output_path) as ome_tiff_file:
+            array, omexml_string = ome_tiff_file.read()
+            np.testing.assert_equal(array, self._test_array)
+            metadata = omexmlClass.OMEXML(omexml_string)
+            self.assertEqual(metadata.image_count, 1)
+            pixels = metadata.image().Pixels
+            self.assertEqual((pixels.SizeZ, pixels.SizeC, pixels.PixelType), (3, 2, "uint8"))
+            self.assertEqual((pixels.PhysicalSizeZ, pixels.Channel(0).Name), (2.0, "DAPI"))
+            # the plane at Z=4 is outside of the new image
+            self.assertEqual(pixels.plane_count, 1)
+
+    def test_write_zstacks_out_of_order(self):
+        with OmeTiffWriter(
+            self._output_path,
+            self._test_array.shape,
+            self._test_array.dtype,
+            compression="adobe_deflate",
+        ) as writer:
+            zstacks = ((t, c, self._test_array[t, :, c]) for c in (1, 0) for t in (1, 0))
+            for t, c, zstack in zstacks:
+                writer.write_zstack(zstack, t=t, c=c)
+
+        with OmeTiffFile(self._output_path) as ome_tiff_file:
+            array, omexml_string = ome_tiff_file.read()
+            np.testing.assert_equal(array, self._test_array)
+            np.testing.assert_equal(ome_tiff_file.read_plane(t=1, z=2, c=0), self._test_array[1, 2, 0])
+
+    def test_close(self):
+        with OmeTiffWriter(self._output_path, self._test_array.shape, self._test_array.dtype) as writer:
+            writer.write_zstack(self._test_array[0, :, 0], t=0, c=0)
+            writer.close()
+        writer.close()
+
+        with OmeTiffFile(self._output_path) as ome_tiff_file:
+            np.testing.assert_equal(ome_tiff_file.read_plane(z=2), self._test_array[0, 2, 0])
+
+        writer = OmeTiffWriter(self._output_path, self._test_array.shape, self._test_array.dtype)
+        with self.assertRaises(ValueError):
+            writer.close()
+
+    def test_write_invalid_plane(self):
+        with OmeTiffWriter(self._output_path, self._test_array.shape, self._test_array.dtype) as writer:
+            with self.assertRaises(ValueError):
+                writer.write_plane(self._test_array[0, 0, 0].astype(np.uint16), t=0, z=0, c=0)
+            writer.write_plane(self._test_array[0, 0, 0], t=0, z=0, c=0)
+            with self.assertRaises(ValueError):
+                writer.write_plane(self._test_array[0, 0, 0], t=0, z=0, c=0)
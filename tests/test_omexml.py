@@ -0,0 +1,122 @@
+import unittest
+
+import numpy as np
+
+from apeer_ometiff_library import omexmlClass
+
+
+class TestPixels(unittest.TestCase):
+    def setUp(self) -> None:
+        self.metadata = omexmlClass.OMEXML()
+        self.pixels = self.metadata.image().Pixels
+        self.pixels.SizeZ = 3
+        self.pixels.SizeT = 2
+
+    def test_channels(self):
+        self.pixels.channel_count = 3
+        for i in range(3):
+            self.pixels.Channel(i).Name = "C:" + str(i)
+        self.assertEqual(self.pixels.get_channel_names(), ["C:0", "C:1", "C:2"])
+
+        self.pixels.remove_channel(1)
+        self.assertEqual(self.metadata.image().Pixels.get_channel_names(), ["C:0", "C:2"])
+        self.pixels.append_channel(3, "C:3")
+        self.assertEqual(self.pixels.channel_count, 3)
+        self.assertEqual(self.pixels.Channel(2).Name, "C:3")
+
+    def test_get_plane(self):
+        self.pixels.channel_count = 0
+        self.pixels.append_channel(0, "C:0")
+        self.pixels.append_channel(1, "C:1")
+        self.assertEqual(self.pixels.plane_count, 12)
+
+        plane = self.pixels.get_plane(the_z=2, the_c=1, the_t=1)
+        self.assertEqual((plane.TheZ, plane.TheC, plane.TheT), (2, 1, 1))
+        plane.TheZ = 5
+        self.assertIs(self.pixels.get_plane(5, 1, 1).node, plane.node)
+        with self.assertRaises(KeyError):
+            self.pixels.get_plane(2, 1, 1)
+
+        # misses don't rebuild a current lookup
+        planes = omexmlClass.get_child_index(self.pixels.node).planes
+        with self.assertRaises(KeyError):
+            self.pixels.get_plane(0, 2, 0)
+        self.assertIs(omexmlClass.get_child_index(self.pixels.node).planes, planes)
+
+        plane.node.set("TheT", "3")
+        omexmlClass.invalidate_node_indexes(self.pixels.node)
+        self.assertIs(self.pixels.get_plane(5, 1, 3).node, plane.node)
+
+    def test_tiff_data_after_replacing_children(self):
+        self.pixels.populate_TiffData()
+        self.assertEqual(self.pixels.TiffData(5).IFD, 5)
+        # replace the TiffData elements without going through Pixels
+        for node in list(self.pixels.node.findall(omexmlClass.qn(self.pixels.ns["ome"], "TiffData"))):
+            self.pixels.node.remove(node)
+        for ifd in range(6):
+            tiff_data = omexmlClass.OMEXML.TiffData(
+                omexmlClass.ElementTree.SubElement(
+                    self.pixels.node, omexmlClass.qn(self.pixels.ns["ome"], "TiffData")
+                )
+            )
+            tiff_data.IFD = 10 + ifd
+        self.assertEqual(self.pixels.TiffData(5).IFD, 15)
+
+    def test_planes_table(self):
+        self.pixels.plane_count = 3
+        self.pixels.Plane(1).TheZ = 1
+        self.pixels.Plane(1).DeltaT = 0.5
+        table = self.pixels.planes_table()
+        self.assertEqual(table.dtype, omexmlClass.PLANES_TABLE_DTYPE)
+        np.testing.assert_equal(table["TheZ"], [0, 1, 0])
+        np.testing.assert_equal(table["DeltaT"], [np.nan, 0.5, np.nan])
+
+        table = np.zeros(4, omexmlClass.PLANES_TABLE_DTYPE)
+        table["TheT"] = np.arange(4)
+        table["DeltaT"] = np.arange(4) * 1.5
+        table["PositionX"] = np.nan
+        self.pixels.set_planes_table(table)
+        self.assertEqual(self.pixels.plane_count, 4)
+        self.assertEqual(self.pixels.Plane(3).DeltaT, 4.5)
+        self.assertIsNone(self.pixels.Plane(3).PositionX)
+        self.assertEqual(self.pixels.get_plane(the_t=2).TheT, 2)
+        result = self.pixels.planes_table()
+        for name in table.dtype.names:
+            np.testing.assert_equal(result[name], table[name])
+
+    def test_populate_tiff_data_compact(self):
+        self.pixels.populate_TiffData()
+        self.assertEqual(len(self.pixels.node.findall(omexmlClass.qn(self.pixels.ns["ome"], "TiffData"))), 6)
+        self.pixels.populate_TiffData(compact=True)
+        self.assertEqual(len(self.pixels.node.findall(omexmlClass.qn(self.pixels.ns["ome"], "TiffData"))), 1)
+        tiff_data = self.pixels.TiffData(0)
+        self.assertEqual((tiff_data.IFD, tiff_data.PlaneCount), (0, 6))
+
+
+class TestStructuredAnnotations(unittest.TestCase):
+    def setUp(self) -> None:
+        self.metadata = omexmlClass.OMEXML()
+
+    def test_original_metadata(self):
+        annotations = self.metadata.structured_annotations
+        first_id = annotations.add_original_metadata("Key0", "a")
+        annotations.add_original_metadata("Key1", "b")
+        last_id = annotations.add_original_metadata("Key0", "c")
+
+        annotations = self.metadata.structured_annotations
+        self.assertTrue(annotations.has_key(first_id))
+        self.assertIn(last_id, annotations)
+        self.assertEqual(annotations[last_id].get("ID"), last_id)
+        with self.assertRaises(IndexError):
+            annotations["missing"]
+        self.assertTrue(annotations.has_original_metadata("Key1"))
+        self.assertFalse(annotations.has_original_metadata("Key2"))
+        # the first of several items with the same key is returned
+        self.assertEqual(annotations.get_original_metadata_value("Key0"), "a")
+        self.assertEqual(annotations.get_original_metadata_value("Key2", "default"), "default")
+        self.assertEqual(annotations.get_original_metadata_refs([last_id, first_id]), {"Key0": "c"})
+
+        original_metadata = annotations.OriginalMetadata
+        original_metadata["Key2"] = "d"
+        self.assertEqual(original_metadata["Key2"], "d")
+        self.assertEqual(len(original_metadata), 4)
@@ -0,0 +1,157 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from apeer_ometiff_library import omexmlClass, processing
+from apeer_ometiff_library.io import gen_xml, read_ometiff, write_ometiff
+
+
+def _invert(plane, maximum=255):
+    return (maximum - plane).astype(np.float32)
+
+
+class TestApply2dTrafo(unittest.TestCase):
+    def setUp(self) -> None:
+        self._test_array = np.random.randint(0, 255, (2, 3, 4, 16, 8), dtype=np.uint8)
+        self._expected = (100 - self._test_array).astype(np.float32)
+
+    def test_apply_2d_trafo(self):
+        array = processing.apply_2d_trafo(_invert, self._test_array, maximum=100)
+        np.testing.assert_equal(array, self._expected)
+
+    def test_apply_2d_trafo_executor(self):
+        for executor in ("thread", "process"):
+            array = processing.apply_2d_trafo(
+                _invert, self._test_array, executor=executor, max_workers=2, maximum=100
+            )
+            np.testing.assert_equal(array, self._expected)
+
+        array = processing.apply_2d_trafo(
+            _invert, self._test_array, executor="shared_memory", max_workers=2, maximum=100
+        )
+        np.testing.assert_equal(array, self._expected)
+
+        with ThreadPoolExecutor(2) as executor:
+            array = processing.apply_2d_trafo(_invert, self._test_array, executor=executor, maximum=100)
+        np.testing.assert_equal(array, self._expected)
+
+        with self.assertRaises(ValueError):
+            processing.apply_2d_trafo(_invert, self._test_array, executor="gpu")
+
+    def test_apply_2d_trafo_batch_size(self):
+        batches = []
+
+        def invert(planes):
+            batches.append(planes.shape)
+            return _invert(planes, maximum=100)
+
+        array = processing.apply_2d_trafo(invert, self._test_array, batch_size=5)
+        np.testing.assert_equal(array, self._expected)
+        self.assertEqual(batches, [(5, 16, 8)] * 4 + [(4, 16, 8)])
+
+        array = processing.apply_2d_trafo(
+            _invert, self._test_array, batch_size=7, executor="thread", maximum=100
+        )
+        np.testing.assert_equal(array, self._expected)
+
+        # non-contiguous inputs are batched without copying them as a whole
+        czt = np.ascontiguousarray(self._test_array.transpose((2, 1, 0, 3, 4)))
+        transposed = czt.transpose((2, 1, 0, 3, 4))
+        for executor in (None, "shared_memory"):
+            array = processing.apply_2d_trafo(
+                _invert, transposed, batch_size=5, executor=executor, max_workers=2, maximum=100
+            )
+            np.testing.assert_equal(array, self._expected)
+
+        with tempfile.TemporaryDirectory() as directory:
+            memmap = np.lib.format.open_memmap(
+                os.path.join(directory, "planes.npy"), mode="w+", dtype=np.uint8, shape=(4, 3, 2, 16, 8)
+            )
+            memmap[...] = czt
+            array = processing.apply_2d_trafo(
+                _invert, memmap.transpose((2, 1, 0, 3, 4)), batch_size=5, maximum=100
+            )
+            del memmap
+        np.testing.assert_equal(array, self._expected)
+
+    def test_apply_2d_trafo_blocks(self):
+        def box_filter(plane):
+            # 3x3 mean with edge padding
+            padded = np.pad(plane.astype(np.float64), 1, mode="edge")
+            return sum(
+                padded[dy:dy + plane.shape[0], dx:dx + plane.shape[1]]
+                for dy in range(3) for dx in range(3)
+            ) / 9
+
+        expected = processing.apply_2d_trafo(box_filter, self._test_array)
+        for block_shape, halo, executor in (((5, 3), 1, None), ((16, 2), (0, 1), "thread")):
+            array = processing.apply_2d_trafo_blocks(
+                box_filter, self._test_array, block_shape, halo=halo, executor=executor
+            )
+            np.testing.assert_allclose(array, expected)
+
+
+class TestApply3dTrafoZstack(unittest.TestCase):
+    def setUp(self) -> None:
+        self._test_array = np.random.randint(0, 255, (2, 7, 3, 16, 8), dtype=np.uint8)
+
+    @staticmethod
+    def _z_max_filter(zstack):
+        # maximum over the planes z - 1 to z + 1
+        padded = np.pad(zstack, ((1, 1), (0, 0), (0, 0)), mode="edge")
+        return np.maximum(np.maximum(padded[:-2], padded[1:-1]), padded[2:])
+
+    def test_apply_3d_trafo_zstack(self):
+        array = processing.apply_3d_trafo_zstack(self._z_max_filter, self._test_array)
+        np.testing.assert_equal(array[1, :, 2], self._z_max_filter(self._test_array[1, :, 2]))
+
+    def test_apply_3d_trafo_zstack_slabs(self):
+        expected = processing.apply_3d_trafo_zstack(self._z_max_filter, self._test_array)
+        for slab_size, executor in ((1, None), (3, "thread"), (2, "shared_memory")):
+            array = processing.apply_3d_trafo_zstack(
+                self._z_max_filter, self._test_array, slab_size=slab_size, halo=1, executor=executor,
+                max_workers=2,
+            )
+            np.testing.assert_equal(array, expected)
+
+
+class TestApplyTrafoToFile(unittest.TestCase):
+    def setUp(self) -> None:
+        self._test_array = np.random.randint(0, 255, (2, 3, 4, 16, 8), dtype=np.uint8)
+        self._input_path = "test_processing_input.ome.tiff"
+        self._output_path = "test_processing_output.ome.tiff"
+        metadata = omexmlClass.OMEXML(gen_xml(self._test_array))
+        metadata.image().Pixels.set_PhysicalSizeX(0.5)
+        metadata.image().Pixels.Channel(1).set_Name("GFP")
+        write_ometiff(self._input_path, self._test_array, metadata.to_xml().encode())
+
+    def tearDown(self) -> None:
+        os.remove(self._input_path)
+        os.remove(self._output_path)
+
+    def test_apply_2d_trafo_to_file(self):
+        processing.apply_2d_trafo_to_file(
+            _invert, self._input_path, self._output_path, compression="adobe_deflate", maximum=100
+        )
+        array, omexml_string = read_ometiff(self._output_path)
+        np.testing.assert_equal(array, (100 - self._test_array).astype(np.float32))
+        pixels = omexmlClass.OMEXML(omexml_string).image().Pixels
+        self.assertEqual(pixels.PhysicalSizeX, 0.5)
+        self.assertEqual(pixels.Channel(1).Name, "GFP")
+        self.assertEqual(pixels.PixelType, "float")
+
+        with self.assertRaises(ValueError):
+            processing.apply_2d_trafo_to_file(_invert, self._input_path, self._output_path,
+                                              executor="shared_memory")
+
+    def test_apply_3d_trafo_zstack_to_file(self):
+        processing.apply_3d_trafo_zstack_to_file(
+            np.cumsum, self._input_path, self._output_path, max_workers=2, axis=0, dtype=np.uint16
+        )
+        array, omexml_string = read_ometiff(self._output_path)
+        np.testing.assert_equal(array, np.cumsum(self._test_array, axis=1, dtype=np.uint16))
+        pixels = omexmlClass.OMEXML(omexml_string).image().Pixels
+        self.assertEqual((pixels.PhysicalSizeX, pixels.Channel(1).Name), (0.5, "GFP"))